@@ -0,0 +1,87 @@
+"""Checks the startup time of `import nelson.gtomscs` and `nelson --help` against a budget.
+
+Every measurement is the median of fresh interpreters.  Budgets are
+milliseconds on top of a reference on the same machine, so they hold on
+slow and fast hardware alike:
+
+  import nelson.gtomscs / nelson.udacity   over `import requests`, which they can't avoid
+  nelson --help                            over an empty interpreter
+
+Modules that only some paths need (requests_toolbelt, pkg_resources,
+asyncio, and requests for --help) must not be loaded at all.  The exit
+status is 1 if a budget is exceeded or one of them is.  Example:
+
+    python benchmarks/bench_import.py --repeat 20 --json startup.json
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+HELP = "import sys; sys.argv = ['nelson', '--help']; from nelson.developer import main_func; main_func()"
+LOADED = "; import sys; print(' '.join(sorted(sys.modules)))"
+
+#name: (code, reference code, budget in ms, modules that must not be loaded)
+CASES = [
+  ('import nelson.gtomscs', 'import nelson.gtomscs', 'import requests', 40.,
+   ['requests_toolbelt', 'pkg_resources', 'asyncio']),
+  ('import nelson.udacity', 'import nelson.udacity', 'import requests', 40.,
+   ['requests_toolbelt', 'pkg_resources', 'asyncio']),
+  ('nelson --help', HELP, 'pass', 40.,
+   ['requests', 'requests_toolbelt', 'pkg_resources', 'asyncio', 'nelson.gtomscs', 'nelson.udacity']),
+]
+
+def run_ms(code):
+  start = time.time()
+  subprocess.check_call([sys.executable, '-c', code], stdout = subprocess.DEVNULL)
+  return (time.time() - start) * 1000
+
+def median_ms(code, repeat):
+  times = sorted(run_ms(code) for _ in range(repeat))
+  return times[len(times) // 2]
+
+def loaded_modules(code):
+  #--help exits before anything after it runs, so check the import alone
+  code = code.replace('main_func()', 'main_func') + LOADED
+  return set(subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').split())
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--repeat', type=int, default=11, help="interpreters started per measurement")
+  parser.add_argument('--slack', type=float, default=1., help="multiplies every budget")
+  parser.add_argument('--json', help="also write the results to this file")
+  args = parser.parse_args()
+
+  results = []
+  failed = False
+  for name, code, reference, budget, forbidden in CASES:
+    #Warm the OS caches so that the first case isn't penalized
+    run_ms(code)
+    reference_ms = median_ms(reference, args.repeat)
+    total_ms = median_ms(code, args.repeat)
+    unwanted = sorted(m for m in loaded_modules(code) if m in forbidden)
+    ok = total_ms - reference_ms <= budget * args.slack and not unwanted
+    failed = failed or not ok
+    results.append({'name': name,
+                    'ms': total_ms,
+                    'reference_ms': reference_ms,
+                    'overhead_ms': total_ms - reference_ms,
+                    'budget_ms': budget * args.slack,
+                    'unwanted_modules': unwanted,
+                    'ok': ok})
+
+  print("{:<24} {:>8} {:>10} {:>10} {:>8}".format('case', 'ms', 'overhead', 'budget', ''))
+  for r in results:
+    print("{name:<24} {ms:>8.1f} {overhead_ms:>10.1f} {budget_ms:>10.1f} {0:>8}".format('ok' if r['ok'] else 'OVER', **r))
+    if r['unwanted_modules']:
+      print("    loaded: " + ', '.join(r['unwanted_modules']))
+
+  if args.json:
+    with open(args.json, 'w') as fd:
+      json.dump({'python': sys.version.split()[0], 'results': results}, fd, indent=2)
+
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,93 @@
+"""Compares archiving a large file through buffered reads and through mmap.
+
+Each run happens in a fresh subprocess so that peak RSS is measured per
+variant.  Example:
+
+    python benchmarks/bench_mmap.py --size-mb 512 --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import zipfile
+
+VARIANTS = ['zipfile', 'buffered', 'mmap']
+COMPRESSIONS = {'stored': zipfile.ZIP_STORED, 'deflated': zipfile.ZIP_DEFLATED}
+
+def peak_rss_bytes():
+  import resource
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  #ru_maxrss is in bytes on macOS and kilobytes elsewhere
+  return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_variant(variant, compression, filename, zipfilename):
+  import nelson.archive as archive
+
+  entries = [(filename, os.path.basename(filename))]
+  start = time.time()
+  if variant == 'zipfile':
+    with zipfile.ZipFile(zipfilename, 'w', COMPRESSIONS[compression]) as z:
+      z.write(filename, os.path.basename(filename))
+  else:
+    archive.MMAP_MIN_SIZE = 0 if variant == 'mmap' else float('inf')
+    archive.write_zip(zipfilename, entries, compression = COMPRESSIONS[compression])
+  elapsed = time.time() - start
+
+  return {'variant': variant,
+          'compression': compression,
+          'seconds': elapsed,
+          'mb_per_s': os.path.getsize(filename) / float(1 << 20) / elapsed,
+          'peak_rss_mb': peak_rss_bytes() / float(1 << 20)}
+
+def make_input(path, size, compressible):
+  block = (b'nelson benchmark line of fairly compressible text\n' * 1400)[:64 << 10]
+  with open(path, 'wb') as fd:
+    for _ in range(size // len(block)):
+      fd.write(block if compressible else os.urandom(len(block)))
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--size-mb', type=int, default=256, help="size of the input file")
+  parser.add_argument('--repeat', type=int, default=3, help="runs per variant; the fastest is kept")
+  parser.add_argument('--random', action='store_true', help="use incompressible input")
+  parser.add_argument('--json', help="also write the results to this file")
+  parser.add_argument('--child', nargs=4, metavar=('VARIANT', 'COMPRESSION', 'INPUT', 'OUTPUT'), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    json.dump(run_variant(*args.child), sys.stdout)
+    return 0
+
+  tmp = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(tmp, 'input.bin')
+    make_input(filename, args.size_mb << 20, not args.random)
+
+    results = []
+    for compression in sorted(COMPRESSIONS):
+      for variant in VARIANTS:
+        runs = []
+        for _ in range(args.repeat):
+          out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child',
+                                         variant, compression, filename, os.path.join(tmp, 'out.zip')])
+          runs.append(json.loads(out.decode('utf-8')))
+        results.append(min(runs, key=lambda r: r['seconds']))
+  finally:
+    shutil.rmtree(tmp)
+
+  print("{:<10} {:<10} {:>10} {:>10} {:>14}".format('compress', 'variant', 'seconds', 'MB/s', 'peak RSS (MB)'))
+  for r in results:
+    print("{compression:<10} {variant:<10} {seconds:>10.3f} {mb_per_s:>10.1f} {peak_rss_mb:>14.1f}".format(**r))
+
+  if args.json:
+    with open(args.json, 'w') as fd:
+      json.dump(results, fd, indent=2)
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,198 @@
+"""Measures archive build and upload throughput against the bonnie stand-in.
+
+Each scenario is a directory of generated files (varying count, size and
+compressibility).  For every scenario and upload mode a fresh subprocess
+builds the zip with mkzip, then submits the same files with
+Submission.submit and polls until graded, so peak RSS is measured per run
+(it includes the stand-in, which runs on a thread of the same process).
+Examples:
+
+    python benchmarks/bench_submit.py --json baseline.json
+    python benchmarks/bench_submit.py --compare baseline.json --tolerance 0.15
+
+With --compare, the exit status is 1 if any run got slower (or bigger)
+than the baseline by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+#name: (file count, file size, fraction of incompressible files)
+SCENARIOS = {
+  'many-small-text': (2000, 4 << 10, 0.),
+  'mixed-medium': (200, 256 << 10, 0.5),
+  'few-large-text': (4, 16 << 20, 0.),
+  'few-large-random': (4, 16 << 20, 1.),
+}
+MODES = ['file', 'stream', 'chunked']
+MODE_OPTIONS = {'file': {}, 'stream': {'stream_upload': True}, 'chunked': {'chunked_upload': True}}
+
+#metric: True if bigger is better
+METRICS = {'zip_mb_per_s': True, 'upload_mb_per_s': True, 'latency_s': False, 'peak_rss_mb': False}
+
+def peak_rss_bytes():
+  import resource
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  #ru_maxrss is in bytes on macOS and kilobytes elsewhere
+  return rss if sys.platform == 'darwin' else rss * 1024
+
+def input_files(directory):
+  return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+def run_scenario(scenario, mode, directory, workdir):
+  import requests
+  from nelson.abstract import mkzip
+  from nelson.standin import BonnieStandin, Submission
+
+  os.chdir(workdir)
+  filenames = input_files(directory)
+  input_bytes = sum(os.path.getsize(f) for f in filenames)
+  max_zip_size = 1 << 40
+
+  start = time.time()
+  mkzip(directory, 'bench.zip', filenames, max_zip_size)
+  zip_seconds = time.time() - start
+  os.unlink('bench.zip')
+
+  standin = BonnieStandin().start()
+  try:
+    submission = Submission(standin.url, requests.Session(), filenames,
+                            zipfile_root = directory,
+                            max_zip_size = max_zip_size,
+                            upload_progress_callback = lambda monitor: None,
+                            **MODE_OPTIONS[mode])
+    start = time.time()
+    submission.submit()
+    upload_seconds = time.time() - start
+    while not submission.poll():
+      time.sleep(0.01)
+    latency = time.time() - start
+  finally:
+    standin.stop()
+
+  return {'scenario': scenario,
+          'mode': mode,
+          'input_mb': input_bytes / float(1 << 20),
+          'zip_mb_per_s': input_bytes / float(1 << 20) / zip_seconds,
+          'upload_mb_per_s': input_bytes / float(1 << 20) / upload_seconds,
+          'latency_s': latency,
+          'peak_rss_mb': peak_rss_bytes() / float(1 << 20)}
+
+def make_inputs(directory, count, size, random_fraction):
+  block = (b'nelson benchmark line of fairly compressible text\n' * 1400)[:64 << 10]
+  os.makedirs(directory)
+  n_random = int(round(count * random_fraction))
+  for i in range(count):
+    with open(os.path.join(directory, 'file%05d.dat' % i), 'wb') as fd:
+      left = size
+      while left > 0:
+        n = min(left, len(block))
+        fd.write(os.urandom(n) if i < n_random else block[:n])
+        left -= n
+
+def nelson_version():
+  """The installed release of nelson, or None when running from an uninstalled tree."""
+  try:
+    from importlib.metadata import version, PackageNotFoundError
+  except ImportError:
+    #Python 3.7
+    return None
+  try:
+    return version('nelson')
+  except PackageNotFoundError:
+    return None
+
+def environment():
+  return {'python': platform.python_version(),
+          'platform': platform.platform(),
+          'nelson': nelson_version(),
+          'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def compare(results, baseline, tolerance):
+  """Lists the metrics that regressed by more than tolerance (a fraction)."""
+  previous = dict(((r['scenario'], r['mode']), r) for r in baseline['results'])
+  regressions = []
+  for r in results:
+    old = previous.get((r['scenario'], r['mode']))
+    if old is None:
+      continue
+    for metric, bigger_is_better in sorted(METRICS.items()):
+      change = (r[metric] - old[metric]) / old[metric]
+      if (-change if bigger_is_better else change) > tolerance:
+        regressions.append("%s/%s %s: %.3f -> %.3f (%+.0f%%)" % (r['scenario'], r['mode'], metric,
+                                                                  old[metric], r[metric], change * 100))
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+  parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+  parser.add_argument('--scale', type=float, default=1., help="multiplies the size of every file")
+  parser.add_argument('--repeat', type=int, default=3, help="runs per scenario and mode; the fastest is kept")
+  parser.add_argument('--json', help="also write the results to this file")
+  parser.add_argument('--compare', metavar='BASELINE', help="json results of an earlier run to compare against")
+  parser.add_argument('--tolerance', type=float, default=0.15, help="allowed regression, as a fraction")
+  parser.add_argument('--child', nargs=4, metavar=('SCENARIO', 'MODE', 'INPUT', 'WORKDIR'), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    json.dump(run_scenario(*args.child), sys.stdout)
+    return 0
+
+  baseline = None
+  if args.compare:
+    with open(args.compare) as fd:
+      baseline = json.load(fd)
+    if baseline.get('scale') != args.scale:
+      parser.error("the baseline was run with --scale %s" % baseline.get('scale'))
+
+  tmp = tempfile.mkdtemp()
+  try:
+    results = []
+    for scenario in args.scenarios:
+      count, size, random_fraction = SCENARIOS[scenario]
+      directory = os.path.join(tmp, scenario)
+      make_inputs(directory, count, max(1, int(size * args.scale)), random_fraction)
+
+      for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+          workdir = tempfile.mkdtemp(dir=tmp)
+          out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child',
+                                         scenario, mode, directory, workdir])
+          shutil.rmtree(workdir)
+          runs.append(json.loads(out.decode('utf-8')))
+        results.append(min(runs, key=lambda r: r['latency_s']))
+
+      shutil.rmtree(directory)
+  finally:
+    shutil.rmtree(tmp)
+
+  print("{:<18} {:<8} {:>9} {:>9} {:>10} {:>10} {:>14}".format('scenario', 'mode', 'input MB', 'zip MB/s',
+                                                                'upload MB/s', 'latency s', 'peak RSS (MB)'))
+  for r in results:
+    print("{scenario:<18} {mode:<8} {input_mb:>9.1f} {zip_mb_per_s:>9.1f} {upload_mb_per_s:>10.1f} "
+          "{latency_s:>10.3f} {peak_rss_mb:>14.1f}".format(**r))
+
+  report = {'environment': environment(), 'scale': args.scale, 'results': results}
+  if args.json:
+    with open(args.json, 'w') as fd:
+      json.dump(report, fd, indent=2, sort_keys=True)
+
+  if baseline is not None:
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+      print("REGRESSION " + line)
+    if regressions:
+      return 1
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,9 +1,3 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-from future import standard_library
-standard_library.install_aliases()
-from builtins import input
-from builtins import object
-
 import os
 import sys
 import zipfile
@@ -11,46 +5,95 @@ import json
 import re
 import getpass
 import errno
-import copy
-from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+import uuid
+import itertools
 import requests
 import time
-import datetime
 from itertools import cycle
 from urllib.parse import urlsplit
 from .uploadcallbacks import default_upload_progress_callback, progressbar_callback
+from .filelist import expand_filenames
+from .sessionbuilder import debug_connection_stats
+from .resumable import ChunkedUploader, DEFAULT_CHUNK_SIZE
+from .polling import PollScheduler, parse_retry_after
+from .events import iter_events, EVENT_STREAM_TYPE
+from .conditional import response_validators, conditional_headers
+from .results import ResultWriter
+from .precheck import PrecheckFailed, PrecheckError, format_summary
+from . import telemetry
+from .archive import iter_zip, write_zip, plan_entries, preflight, zip_entries, file_manifest, too_large_error
+from .archive import deduplicate, add_duplicates_manifest
 
 SUBMISSION_FILENAME = 'student.zip'
+BLOB_CHUNK_SIZE = 64 << 10
+EVENTS_READ_TIMEOUT = 60
+
+def run_precheck(submission, precheck):
+  """Runs a precheck.Precheck on the submission's files and returns False if it failed."""
+  sys.stdout.write("Running local checks...")
+  sys.stdout.flush()
 
-def submit(submission, refresh_time = 3):
+  with telemetry.span('precheck') as span:
+    try:
+      precheck.run(submission.zipfile_root, submission.filenames)
+    except PrecheckError as e:
+      #Not being able to check is no reason to hold the submission back
+      span.set(outcome = 'skipped')
+      print("skipped ({}).\n".format(e))
+      return True
+    except PrecheckFailed as e:
+      span.set(outcome = 'failed')
+      print("failed: {}\n".format(e))
+      print(format_summary(e.feedback) or e.output)
+      print("\nNothing was uploaded.  Fix the problems above and submit again.")
+      return False
+
+    span.set(outcome = 'passed')
+  print("passed.\n")
+  return True
+
+def submit(submission, refresh_time = 3, poll_scheduler = None, push_results = False, result_writer = None,
+           precheck = None):
 
     print("Submission includes the following files:")
     print('\n'.join(['    ' + f for f in submission.filenames]))
     print("")
 
+    #A fast local subset of the grader catches obvious failures before the upload
+    if precheck is not None and not run_precheck(submission, precheck):
+      return
+
     print("Uploading submission...")
     submission.submit()
     print("\n")
 
+    scheduler = poll_scheduler or PollScheduler(initial = refresh_time)
     wheel = cycle(['|', '/', '-', '\\'])
     spin_freq = 8.
-    while not submission.poll():
-      for _ in range(int(refresh_time * spin_freq)):
-        sys.stdout.write("\rWaiting for results... {}".format(next(wheel)))
-        sys.stdout.flush()
-        time.sleep(1. / spin_freq)
-    sys.stdout.write("\rWaiting for results...Done!\n\n")
+
+    #Results pushed by the server arrive as soon as grading is done
+    if push_results:
+      sys.stdout.write("\rWaiting for results...")
+      sys.stdout.flush()
+    with telemetry.span('wait', session = submission.s, push = push_results) as span:
+      done = push_results and submission.listen()
+
+      while not done and not submission.poll():
+        delay = scheduler.next_delay(submission.retry_after, submission.eta())
+        for _ in range(max(1, int(delay * spin_freq))):
+          sys.stdout.write("\rWaiting for results... {}".format(next(wheel)))
+          sys.stdout.flush()
+          time.sleep(1. / spin_freq)
+
+      span.set(polls = submission.poll_count)
+    sys.stdout.write("\rWaiting for results...Done! ({} status checks)\n\n".format(submission.poll_count))
 
     print("Results:\n--------")
     if submission.feedback():
       if submission.console():
         print(submission.console())
 
-      timestamp = "{:%Y-%m-%d-%H-%M-%S}".format(datetime.datetime.now())
-      filename = "%s-result-%s.json" % (submission.project_name(), timestamp)
-
-      with open(filename, "w") as fd:
-          json.dump(submission.feedback(), fd, indent=4, separators=(',', ': '))
+      filename = (result_writer or ResultWriter()).write(submission.project_name(), submission.feedback())
 
       print("\n(Details available in %s)\n" % filename)
 
@@ -60,6 +103,8 @@ def submit(submission, refresh_time = 3):
     else:
         print("Unknown error.")
 
+    debug_connection_stats(submission.s)
+
 #Abstract class for uploading submissions
 class Submission(object):
   
@@ -72,6 +117,15 @@ class Submission(object):
   def _get_poll_url(self):
     raise NotImplementedError()
 
+  def _get_manifest_url(self):
+    return self._get_submit_url() + '/manifest'
+
+  def _get_blob_url(self, digest):
+    return self._get_submit_url() + '/blobs/' + digest
+
+  def _get_events_url(self):
+    return self._get_poll_url() + '/events'
+
   def project_name(self):
     raise NotImplementedError()
 
@@ -80,29 +134,173 @@ class Submission(object):
                filenames,
                max_zip_size = 8 << 20,
                zipfile_root = os.path.dirname(sys.argv[0]),
-               upload_progress_callback = None):
+               upload_progress_callback = None,
+               stream_upload = False,
+               incremental = False,
+               zip_workers = 1,
+               compression_policy = None,
+               chunked_upload = False,
+               upload_chunk_size = DEFAULT_CHUNK_SIZE,
+               archive_cache = None,
+               excludes = None,
+               dedupe = False):
 
     self.s = session
-    self.filenames = copy.deepcopy(filenames)
+    self.filenames = expand_filenames(filenames, excludes)
     self.max_zip_size = max_zip_size
     self.upload_progress_callback = upload_progress_callback or default_upload_progress_callback
     self.zipfile_root = zipfile_root
+    self.stream_upload = stream_upload
+    self.incremental = incremental
+    self.zip_workers = zip_workers
+    self.compression_policy = compression_policy
+    self.chunked_upload = chunked_upload
+    self.upload_chunk_size = upload_chunk_size
+    self.archive_cache = archive_cache
+    self.dedupe = dedupe
+    self.zipfilename = SUBMISSION_FILENAME
+    self.prepared = False
+    self.poll_count = 0
+    self.retry_after = None
+    self.poll_validators = {}
 
   def submit(self):
 
     self.submit_url = self._get_submit_url()
+    self.bytes_uploaded = 0
+
+    with telemetry.span('upload', session = self.s, files = len(self.filenames)) as span:
+      if self.incremental:
+        span.set(mode = 'incremental')
+        self._submit_incremental()
+      elif self.stream_upload:
+        span.set(mode = 'stream')
+        self._submit_stream()
+      elif self.chunked_upload:
+        span.set(mode = 'chunked')
+        self._submit_chunked()
+      else:
+        span.set(mode = 'file')
+        self._submit_file()
 
-    mkzip(self.zipfile_root, SUBMISSION_FILENAME, self.filenames, self.max_zip_size)
+      span.set(bytes = self.bytes_uploaded)
 
-    fd = open(SUBMISSION_FILENAME, "rb")
+  def _track_upload(self, monitor):
+    self.bytes_uploaded = monitor.bytes_read
+    self.upload_progress_callback(monitor)
 
-    m = MultipartEncoder(fields={'zipfile': ('student.zip', fd, 'application/zip')})
-    monitor = MultipartEncoderMonitor(m, self.upload_progress_callback)
+  def prepare(self):
+    """Builds the archive ahead of submit(), for the upload modes that send one."""
+    if not (self.incremental or self.stream_upload):
+      self._mkzip()
+      self.prepared = True
+
+  def _mkzip(self):
+    with telemetry.span('zip', files = len(self.filenames)) as span:
+      mkzip(self.zipfile_root, self.zipfilename, self.filenames, self.max_zip_size,
+            compression = self.compression_policy or zipfile.ZIP_STORED,
+            workers = self.zip_workers,
+            cache = self.archive_cache,
+            dedupe = self.dedupe)
+      span.set(bytes = os.path.getsize(self.zipfilename))
+
+  def _take_zip(self):
+    if not self.prepared:
+      self._mkzip()
+    self.prepared = False
+
+  def _submit_file(self):
+    #Only this upload mode needs requests_toolbelt, so it's loaded here
+    from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+
+    self._take_zip()
+
+    fd = open(self.zipfilename, "rb")
+
+    def body():
+      fd.seek(0)
+      m = MultipartEncoder(fields={'zipfile': ('student.zip', fd, 'application/zip')})
+      monitor = MultipartEncoderMonitor(m, self._track_upload)
+      return {'data': monitor, 'headers': {'Content-Type': monitor.content_type}}
 
     try:
-      r = self.s.post(self.submit_url, 
-                      data=monitor,
-                      headers={'Content-Type': monitor.content_type})
+      self._handle_submission_response(self._send('POST', self.submit_url, body))
+    finally:
+      fd.close()
+
+  def _submit_stream(self):
+    #Fail on bad paths before the request goes out
+    zip_entries(self.zipfile_root, self.filenames)
+
+    def body():
+      stream = MultipartStream('zipfile', 'student.zip', 'application/zip',
+                               iter_zip(self.zipfile_root, self.filenames, self.max_zip_size,
+                                        compression = self.compression_policy or zipfile.ZIP_DEFLATED,
+                                        dedupe = self.dedupe),
+                               self._track_upload)
+      return {'data': stream, 'headers': {'Content-Type': stream.content_type}}
+
+    self._handle_submission_response(self._send('POST', self.submit_url, body))
+
+  def _submit_incremental(self):
+    entries = zip_entries(self.zipfile_root, self.filenames)
+    manifest = file_manifest(entries)
+
+    #A stored zip is never smaller than its contents
+    if sum(f['size'] for f in manifest) > self.max_zip_size:
+      raise too_large_error(self.max_zip_size)
+
+    r = self.s.post(self._get_manifest_url(), json={'files': manifest})
+    r.raise_for_status()
+    missing = set(r.json()['missing'])
+
+    blobs = {}
+    for (f, _), entry in zip(entries, manifest):
+      if entry['sha256'] in missing:
+        blobs.setdefault(entry['sha256'], (f, entry['size']))
+
+    progress = UploadProgress(sum(size for _, size in blobs.values()), self._track_upload)
+    for digest, (f, _) in sorted(blobs.items()):
+      def body(f = f, sent = progress.bytes_read):
+        progress.bytes_read = sent
+        return {'data': progress.iter_file(f, BLOB_CHUNK_SIZE),
+                'headers': {'Content-Type': 'application/octet-stream'}}
+
+      r = self._send('PUT', self._get_blob_url(digest), body)
+      r.raise_for_status()
+
+    self.uploaded_blobs = len(blobs)
+    self._post_submission(json={'manifest': manifest})
+
+  def _submit_chunked(self):
+    self._take_zip()
+
+    progress = UploadProgress(os.path.getsize(self.zipfilename), self._track_upload)
+    uploader = ChunkedUploader(self.s, self.submit_url, self.zipfilename, progress,
+                               chunk_size = self.upload_chunk_size)
+
+    self._handle_submission_response(uploader.upload())
+    self.upload_retries = uploader.retries
+
+  def _send(self, method, url, body):
+    """Sends the request whose keyword arguments body() builds.
+
+    A streamed body is used up by the time a 401 comes back, so the
+    session's reauthentication hook can't resend it.  If the hook did
+    switch to a new token, the body is built again and sent once more.
+    """
+    r = self.s.request(method, url, **body())
+    if r.status_code == 401 and r.request.headers.get('authorization') != self.s.headers.get('authorization'):
+      r.content
+      r.close()
+      r = self.s.request(method, url, **body())
+    return r
+
+  def _post_submission(self, **kwargs):
+    self._handle_submission_response(self.s.post(self.submit_url, **kwargs))
+
+  def _handle_submission_response(self, r):
+    try:
       r.raise_for_status()
     except requests.exceptions.HTTPError as e:
       if r.status_code == 403:
@@ -117,18 +315,70 @@ class Submission(object):
       else:
         raise
 
-    fd.close()
-
     self.submission = r.json()
 
   def poll(self):
-    r = self.s.get(self._get_poll_url())
+    r = self.s.get(self._get_poll_url(), headers = conditional_headers(self.poll_validators))
+    self.poll_count += 1
+    telemetry.event('poll', status = r.status_code)
+    self.retry_after = parse_retry_after(r.headers.get('Retry-After'))
+
+    #Throttled: still pending, try again once the server allows it
+    if r.status_code in [429, 503] and self.retry_after is not None:
+      return False
+
+    #Unchanged since the last poll, which was still pending
+    if r.status_code == 304:
+      return False
+
     r.raise_for_status()
 
     self.submission = r.json()
+    self.poll_validators = response_validators(r)
 
     return self.submission['feedback'] is not None or self.submission['error_report'] is not None
 
+  def listen(self, timeout = None):
+    """Waits for the result on the submission's event stream instead of polling.
+
+    Returns True once the submission is graded, and False if the server
+    has no event stream, the stream breaks or ends early, or timeout
+    seconds pass; poll() then takes over where listening left off.
+    """
+    try:
+      r = self.s.get(self._get_events_url(),
+                     headers = {'Accept': EVENT_STREAM_TYPE},
+                     stream = True,
+                     timeout = EVENTS_READ_TIMEOUT)
+    except requests.exceptions.RequestException:
+      return False
+
+    try:
+      if r.status_code != 200 or not r.headers.get('Content-Type', '').startswith(EVENT_STREAM_TYPE):
+        return False
+
+      r.encoding = 'utf-8'
+      lines = r.iter_lines(decode_unicode = True)
+      if timeout is not None:
+        deadline = time.time() + timeout
+        lines = itertools.takewhile(lambda _: time.time() < deadline, lines)
+
+      for event, data in iter_events(lines):
+        if event == 'status':
+          self.submission = json.loads(data)
+          if self.submission['feedback'] is not None or self.submission['error_report'] is not None:
+            return True
+    except (requests.exceptions.RequestException, ValueError):
+      pass
+    finally:
+      r.close()
+
+    return False
+
+  def eta(self):
+    """Server's estimate of the seconds left until the result is ready, if it gave one."""
+    return self.submission.get('eta_seconds')
+
   def result(self):
     return self.feedback()
 
@@ -142,18 +392,82 @@ class Submission(object):
     return self.submission['error_report']
 
 
-#Zipfile helper function
-def mkzip(root_path, zipfilename, filenames, max_zip_size):
-  abs_root_path = os.path.abspath(root_path)
-  abspaths = [os.path.abspath(x) for x in filenames]
-
-  if os.path.commonprefix([abs_root_path] + abspaths) != abs_root_path:
-    raise ValueError("Submitted files must in subdirectories of %s." % (root_path or "./"))
+#Progress reporting for uploads that don't go through MultipartEncoderMonitor
+class UploadProgress(object):
+  """Presents bytes_read and encoder.len to upload callbacks."""
+  def __init__(self, total, callback = None):
+    self.encoder = self
+    self.len = total
+    self.bytes_read = 0
+    self.callback = callback or default_upload_progress_callback
+
+  def advance(self, nbytes):
+    self.bytes_read += nbytes
+    self.callback(self)
+
+  def iter_file(self, filename, chunk_size):
+    with open(filename, 'rb') as fd:
+      while True:
+        block = fd.read(chunk_size)
+        if not block:
+          break
+        self.advance(len(block))
+        yield block
+
+#Multipart body produced on the fly, sent with chunked transfer encoding
+class MultipartStream(object):
+  """Wraps an iterable of file bytes in a single-field multipart/form-data body.
+
+  Mirrors the parts of MultipartEncoderMonitor that upload callbacks use:
+  the callback receives this object after every chunk, with bytes_read
+  counting what has been handed to the connection so far.  Since the
+  total is not known up front, encoder.len is None until the last chunk
+  has been produced.
+  """
+  def __init__(self, field_name, filename, content_type, chunks, callback = None):
+    self.boundary = uuid.uuid4().hex
+    self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+    self.head = ('--%s\r\n'
+                 'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                 'Content-Type: %s\r\n\r\n' % (self.boundary, field_name, filename, content_type)).encode('utf-8')
+    self.tail = ('\r\n--%s--\r\n' % self.boundary).encode('utf-8')
+    self.chunks = chunks
+    self.callback = callback or default_upload_progress_callback
+    self.encoder = self
+    self.len = None
+    self.bytes_read = 0
+
+  def _sent(self, data):
+    self.bytes_read += len(data)
+    self.callback(self)
+    return data
+
+  def __iter__(self):
+    yield self._sent(self.head)
+    for chunk in self.chunks:
+      yield self._sent(chunk)
+    self.len = self.bytes_read + len(self.tail)
+    yield self._sent(self.tail)
 
-  with zipfile.ZipFile(zipfilename,'w') as z:
-    for f in filenames:
-      zpath = os.path.relpath(f, root_path)
-      z.write(f, zpath)
+#Zipfile helper function
+def mkzip(root_path, zipfilename, filenames, max_zip_size,
+          compression = zipfile.ZIP_STORED,
+          workers = 1,
+          cache = None,
+          dedupe = False):
+  planned = plan_entries(zip_entries(root_path, filenames), compression)
+  duplicates = {}
+  if dedupe:
+    planned, duplicates = deduplicate(planned)
+  preflight(planned, max_zip_size)
+
+  if cache is not None:
+    cache.build(zipfilename, planned, max_zip_size = max_zip_size)
+  else:
+    write_zip(zipfilename, planned, workers = workers, max_zip_size = max_zip_size)
+
+  if duplicates:
+    add_duplicates_manifest(zipfilename, duplicates)
 
   if os.stat(zipfilename).st_size > max_zip_size:
-    raise ValueError("Your zipfile exceeded the limit of %d bytes" % max_zip_size)
+    raise too_large_error(max_zip_size)
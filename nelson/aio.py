@@ -0,0 +1,69 @@
+import os
+import tempfile
+import functools
+
+from .polling import PollScheduler
+from .abstract import SUBMISSION_FILENAME
+
+#asyncio is imported where it's used: callers already have it loaded, and
+#importing gtomscs or udacity shouldn't pay for it otherwise.
+
+class AsyncSubmission(object):
+  """Drives a Submission from an asyncio event loop.
+
+  Uploads and status checks still go through the submission's requests
+  session, but run in executor (the loop's default if None) while all
+  waiting between polls happens on the loop.  One loop can therefore
+  keep hundreds of submissions in flight, with threads only in use
+  while a request is actually on the wire.
+
+  Anything not defined here (feedback(), console(), poll_count, ...) is
+  read from the wrapped submission.
+  """
+  def __init__(self, submission, executor = None):
+    self.sync = submission
+    self.executor = executor
+
+  def __getattr__(self, name):
+    return getattr(self.sync, name)
+
+  async def _run(self, fn, *args, **kwargs):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+  async def submit(self):
+    s = self.sync
+
+    #Concurrent submissions must not share student.zip in the working directory
+    private_zip = s.zipfilename == SUBMISSION_FILENAME and not (s.incremental or s.stream_upload)
+    if private_zip:
+      fd, s.zipfilename = tempfile.mkstemp(prefix = 'nelson-', suffix = '.zip')
+      os.close(fd)
+
+    try:
+      await self._run(s.submit)
+    finally:
+      if private_zip:
+        os.unlink(s.zipfilename)
+        s.zipfilename = SUBMISSION_FILENAME
+
+  async def poll(self):
+    return await self._run(self.sync.poll)
+
+  async def wait_for_result(self, refresh_time = 3, poll_scheduler = None, timeout = None):
+    """Polls until the submission is graded and returns its feedback.
+
+    Waits are scheduled as in nelson.abstract.submit.  Raises
+    asyncio.TimeoutError if timeout seconds pass first.  The feedback is
+    None when grading failed; see error_report() in that case.
+    """
+    import asyncio
+    scheduler = poll_scheduler or PollScheduler(initial = refresh_time)
+
+    async def wait():
+      while not await self.poll():
+        await asyncio.sleep(scheduler.next_delay(self.sync.retry_after, self.sync.eta()))
+      return self.sync.result()
+
+    return await asyncio.wait_for(wait(), timeout)
@@ -0,0 +1,493 @@
+import io
+import os
+import mmap
+import zlib
+import zipfile
+import json
+import hashlib
+import warnings
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from .compression import PlannedEntry, as_policy
+
+STREAM_CHUNK_SIZE = 64 << 10
+HASH_CHUNK_SIZE = 1 << 20
+COMPRESS_CHUNK_SIZE = 1 << 20
+
+#Files at least this large are read through mmap, handing the compressor
+#slices of the mapping instead of copying through read() buffers
+MMAP_MIN_SIZE = 16 << 20
+
+#Below these sizes, starting worker processes costs more than it saves
+PARALLEL_MIN_FILES = 2
+PARALLEL_MIN_BYTES = 4 << 20
+
+#Fixed parts of the zip format, not counting the file name
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_RECORD_SIZE = 22
+
+#Pre-flight estimates compress windows spread across the largest files only
+PREFLIGHT_SAMPLE_SIZE = 64 << 10
+PREFLIGHT_SAMPLE_WINDOWS = 8
+PREFLIGHT_SAMPLE_FILES = 32
+PREFLIGHT_MARGIN = 2.0
+
+#Archive member listing files left out as duplicates of another member
+DEDUP_MANIFEST = '.nelson-duplicates.json'
+
+def zip_entries(root_path, filenames):
+  """Returns (filename, archive name) pairs after checking that every file lives under root_path.
+
+  Archive names always use '/', as zip member names and manifest paths
+  must, whatever the platform's separator.  The check is made once per
+  distinct directory rather than once per file.
+  """
+  abs_root_path = os.path.abspath(root_path)
+
+  for d in set(os.path.dirname(f) for f in filenames):
+    #Whole path components, so that a sibling like proj2 isn't inside proj
+    if os.path.commonpath([abs_root_path, os.path.abspath(d)]) != abs_root_path:
+      raise ValueError("Submitted files must in subdirectories of %s." % (root_path or "./"))
+
+  return [(f, os.path.relpath(f, root_path).replace(os.path.sep, '/')) for f in filenames]
+
+def file_digest(filename):
+  """Returns the hex sha256 of a file's contents."""
+  h = hashlib.sha256()
+  with open(filename, 'rb') as fd:
+    while True:
+      block = fd.read(HASH_CHUNK_SIZE)
+      if not block:
+        break
+      h.update(block)
+  return h.hexdigest()
+
+def file_manifest(entries):
+  """Describes each (filename, archive name) entry by path, content hash and size.
+
+  Paths are the '/'-separated archive names from zip_entries, which is
+  what the server rebuilds the zip from.
+  """
+  return [{'path': zpath, 'sha256': file_digest(f), 'size': os.path.getsize(f)}
+          for f, zpath in entries]
+
+def too_large_error(max_zip_size):
+  return ValueError("Your zipfile exceeded the limit of %d bytes" % max_zip_size)
+
+def _name_size(zpath):
+  return len(zpath.encode('utf-8'))
+
+def plan_entries(entries, compression):
+  """Attaches a compression method to each (filename, archive name) entry.
+
+  compression is a zipfile constant or a CompressionPolicy; entries that
+  are already planned are returned unchanged.
+  """
+  if all(isinstance(e, PlannedEntry) for e in entries):
+    return list(entries)
+  return as_policy(compression).plan(entries)
+
+def min_entry_size(entry):
+  """Smallest number of bytes the entry can occupy before the central directory."""
+  data = os.path.getsize(entry.filename) if entry.compress_type == zipfile.ZIP_STORED else 0
+  return LOCAL_HEADER_SIZE + _name_size(entry.arcname) + data
+
+class SizeGuard(object):
+  """Tracks a lower bound on the final archive size while it is written.
+
+  The bound is the bytes written so far, plus the smallest possible size
+  of every entry not yet started, plus the central directory.  Once it
+  passes max_zip_size the archive can only end up too large, so check()
+  raises without waiting for the rest of the build.
+  """
+  def __init__(self, planned, max_zip_size):
+    self.max_zip_size = max_zip_size
+    self.minimums = deque(min_entry_size(e) for e in planned)
+    self.pending = sum(self.minimums)
+    self.central = sum(CENTRAL_HEADER_SIZE + _name_size(e.arcname) for e in planned) + END_RECORD_SIZE
+
+  def lower_bound(self, written):
+    return written + self.pending + self.central
+
+  def check(self, written):
+    if self.max_zip_size is not None and self.lower_bound(written) > self.max_zip_size:
+      raise too_large_error(self.max_zip_size)
+
+  def start_entry(self):
+    self.pending -= self.minimums.popleft()
+
+def sample_file(filename, size):
+  """Up to PREFLIGHT_SAMPLE_SIZE bytes of filename, read from PREFLIGHT_SAMPLE_WINDOWS evenly spaced offsets."""
+  with open(filename, 'rb') as fd:
+    if size <= PREFLIGHT_SAMPLE_SIZE:
+      return fd.read()
+
+    window = PREFLIGHT_SAMPLE_SIZE // PREFLIGHT_SAMPLE_WINDOWS
+    step = (size - window) // (PREFLIGHT_SAMPLE_WINDOWS - 1)
+    sample = []
+    for i in range(PREFLIGHT_SAMPLE_WINDOWS):
+      fd.seek(i * step)
+      sample.append(fd.read(window))
+    return b''.join(sample)
+
+def estimate_zip_size(planned):
+  """Estimates the archive size in a fraction of the time it takes to build it.
+
+  Stored entries are sized exactly.  For the rest, windows spread evenly
+  across the largest files are compressed to get a ratio, so that a file
+  whose head differs from its body (e.g. a header before raw data) isn't
+  judged by its head alone.  Files that were not sampled are assumed to
+  compress like the sampled ones on average.
+  """
+  overhead = sum(LOCAL_HEADER_SIZE + CENTRAL_HEADER_SIZE + 2 * _name_size(e.arcname) for e in planned) + END_RECORD_SIZE
+  sizes = dict((e.filename, os.path.getsize(e.filename)) for e in planned)
+
+  stored = [e for e in planned if e.compress_type == zipfile.ZIP_STORED]
+  compressed = sorted((e for e in planned if e.compress_type != zipfile.ZIP_STORED),
+                      key=lambda e: -sizes[e.filename])
+
+  estimate = float(sum(sizes[e.filename] for e in stored))
+  sampled_in = 0
+  sampled_out = 0.
+  for e in compressed[:PREFLIGHT_SAMPLE_FILES]:
+    sample = sample_file(e.filename, sizes[e.filename])
+    if not sample:
+      continue
+    compressor = _compressor(e.compress_type, e.compresslevel)
+    ratio = float(len(compressor.compress(sample) + compressor.flush())) / len(sample)
+    sampled_in += len(sample)
+    sampled_out += len(sample) * ratio
+    estimate += sizes[e.filename] * ratio
+
+  unsampled = sum(sizes[e.filename] for e in compressed[PREFLIGHT_SAMPLE_FILES:])
+  if unsampled:
+    estimate += unsampled * (sampled_out / sampled_in if sampled_in else 1.)
+
+  return int(estimate) + overhead
+
+def preflight(planned, max_zip_size):
+  """Rejects submissions that cannot fit in max_zip_size, and warns about those unlikely to.
+
+  Only the lower bound of SizeGuard is proof; an estimate well over the
+  limit is just a warning, since the build itself stops as soon as the
+  archive really is too large.
+  """
+  SizeGuard(planned, max_zip_size).check(0)
+
+  if any(e.compress_type != zipfile.ZIP_STORED for e in planned):
+    estimate = estimate_zip_size(planned)
+    if estimate > max_zip_size * PREFLIGHT_MARGIN:
+      warnings.warn("Your zipfile will probably exceed the limit of %d bytes (estimated at %d bytes)" \
+                    % (max_zip_size, estimate))
+
+def deduplicate(planned):
+  """Drops entries whose contents duplicate an earlier entry.
+
+  Only files that share a size with another file are hashed.  Returns the
+  remaining entries and a dict mapping each dropped archive name to the
+  archive name of the entry holding its contents.
+  """
+  by_size = defaultdict(list)
+  for e in planned:
+    by_size[os.path.getsize(e.filename)].append(e)
+
+  duplicates = {}
+  for group in by_size.values():
+    if len(group) < 2:
+      continue
+    originals = {}
+    for e in group:
+      digest = file_digest(e.filename)
+      if digest in originals:
+        duplicates[e.arcname] = originals[digest]
+      else:
+        originals[digest] = e.arcname
+
+  return [e for e in planned if e.arcname not in duplicates], duplicates
+
+def duplicates_manifest(duplicates):
+  return json.dumps({'version': 1, 'duplicates': duplicates}, sort_keys=True).encode('utf-8')
+
+def add_duplicates_manifest(zipfilename, duplicates):
+  with zipfile.ZipFile(zipfilename, 'a') as z:
+    z.writestr(DEDUP_MANIFEST, duplicates_manifest(duplicates))
+
+def expand_duplicates(source, target):
+  """Rewrites a deduplicated archive with every duplicate restored as its own member.
+
+  source and target are file names or file objects.  This is what the
+  receiving side does with archives built with dedupe=True.
+  """
+  with zipfile.ZipFile(source) as zin, zipfile.ZipFile(target, 'w') as zout:
+    names = zin.namelist()
+    duplicates = {}
+    if DEDUP_MANIFEST in names:
+      duplicates = json.loads(zin.read(DEDUP_MANIFEST).decode('utf-8'))['duplicates']
+
+    for info in zin.infolist():
+      if info.filename != DEDUP_MANIFEST:
+        zout.writestr(info, zin.read(info))
+
+    for name in sorted(duplicates):
+      info = zin.getinfo(duplicates[name])
+      copy = zipfile.ZipInfo(name, info.date_time)
+      copy.compress_type = info.compress_type
+      copy.external_attr = info.external_attr
+      zout.writestr(copy, zin.read(info))
+
+def _zipinfo(entry):
+  zinfo = zipfile.ZipInfo.from_file(entry.filename, entry.arcname)
+  zinfo.compress_type = entry.compress_type
+  #Renamed to compress_level in Python 3.13
+  if hasattr(zipfile.ZipInfo, 'compress_level'):
+    zinfo.compress_level = entry.compresslevel
+  elif hasattr(zipfile.ZipInfo, '_compresslevel'):
+    zinfo._compresslevel = entry.compresslevel
+  return zinfo
+
+#Private parts of zipfile that _compress_file and _write_compressed rely on
+ZIPFILE_INTERNALS = ['_writecheck', '_didModify', 'start_dir', '_allowZip64', 'fp', 'filelist', 'NameToInfo']
+_zip_internals = None
+
+def zip_internals_available():
+  """Whether this Python's zipfile has everything that writing precompressed entries needs.
+
+  Checked once.  Without them, archives are written serially through the
+  public ZipFile API, which is slower but gives the same bytes.
+  """
+  global _zip_internals
+  if _zip_internals is None:
+    with zipfile.ZipFile(io.BytesIO(), 'w') as z:
+      _zip_internals = hasattr(zipfile, '_get_compressor') \
+                       and all(hasattr(z, name) for name in ZIPFILE_INTERNALS) \
+                       and (hasattr(zipfile.ZipInfo, 'compress_level') or hasattr(zipfile.ZipInfo, '_compresslevel'))
+  return _zip_internals
+
+def _compressor(compress_type, compresslevel):
+  if hasattr(zipfile, '_get_compressor'):
+    return zipfile._get_compressor(compress_type, compresslevel)
+  #Near enough for estimates
+  return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel, zlib.DEFLATED, -15)
+
+class _ChunkSink(object):
+  """Write-only, unseekable file object that collects what zipfile writes.
+
+  Because it cannot seek, zipfile falls back to data descriptors and
+  never needs to revisit bytes it has already written, so the buffered
+  chunks can be handed off as soon as they are produced.
+  """
+  def __init__(self):
+    self.chunks = []
+    self.buffered = 0
+    self.position = 0
+
+  def write(self, data):
+    data = bytes(data)
+    self.chunks.append(data)
+    self.buffered += len(data)
+    self.position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self.position
+
+  def flush(self):
+    pass
+
+  def drain(self):
+    chunks, self.chunks, self.buffered = self.chunks, [], 0
+    return b''.join(chunks)
+
+def iter_zip(root_path, filenames, max_zip_size,
+             compression = zipfile.ZIP_DEFLATED,
+             chunk_size = STREAM_CHUNK_SIZE,
+             dedupe = False):
+  """Generates the bytes of a zip archive of filenames without touching the disk.
+
+  Each file is read and compressed chunk_size bytes at a time, and
+  output is yielded whenever at least chunk_size bytes are buffered, so
+  memory use stays bounded regardless of the size of the submission.
+  compression is a zipfile constant or a CompressionPolicy.  With
+  dedupe, repeated contents are stored once (see deduplicate).
+  A ValueError is raised as soon as the output can no longer fit in
+  max_zip_size.  Requires Python 3.6 or later.
+  """
+  planned = plan_entries(zip_entries(root_path, filenames), compression)
+  duplicates = {}
+  if dedupe:
+    planned, duplicates = deduplicate(planned)
+  preflight(planned, max_zip_size)
+  guard = SizeGuard(planned, max_zip_size)
+
+  sink = _ChunkSink()
+
+  def emit():
+    guard.check(sink.position)
+    return sink.drain()
+
+  with zipfile.ZipFile(sink, 'w') as z:
+    for entry in planned:
+      guard.start_entry()
+      with open(entry.filename, 'rb') as src, z.open(_zipinfo(entry), 'w') as dst:
+        for block in file_blocks(src, chunk_size):
+          dst.write(block)
+          if sink.buffered >= chunk_size:
+            yield emit()
+      if sink.buffered >= chunk_size:
+        yield emit()
+
+    if duplicates:
+      z.writestr(DEDUP_MANIFEST, duplicates_manifest(duplicates))
+
+  if sink.position > max_zip_size:
+    raise too_large_error(max_zip_size)
+
+  data = sink.drain()
+  if data:
+    yield data
+
+def file_blocks(fd, chunk_size, mmap_min_size = None):
+  """Yields the contents of an open binary file in chunk_size pieces.
+
+  Files of at least mmap_min_size bytes (MMAP_MIN_SIZE by default) are
+  memory-mapped and yielded as memoryview slices of the mapping, which
+  are released as soon as the consumer asks for the next one; callers
+  must copy a block if they need to keep it.
+  """
+  if mmap_min_size is None:
+    mmap_min_size = MMAP_MIN_SIZE
+
+  size = os.fstat(fd.fileno()).st_size
+  if size == 0 or size < mmap_min_size:
+    while True:
+      block = fd.read(chunk_size)
+      if not block:
+        return
+      yield block
+
+  mapping = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+  #Dropping pages behind the reader keeps them from piling up in our RSS
+  drop_pages = hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_DONTNEED') \
+               and chunk_size % mmap.PAGESIZE == 0
+  if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+    mapping.madvise(mmap.MADV_SEQUENTIAL)
+
+  view = memoryview(mapping)
+  try:
+    for offset in range(0, size, chunk_size):
+      block = view[offset:offset + chunk_size]
+      try:
+        yield block
+      finally:
+        block.release()
+        if drop_pages:
+          mapping.madvise(mmap.MADV_DONTNEED, offset, min(chunk_size, size - offset))
+  finally:
+    view.release()
+    mapping.close()
+
+def _compress_file(filename, compress_type, compresslevel):
+  """Compresses one file exactly as ZipFile.write would.
+
+  Runs in a worker process and returns (crc, file_size, compressed bytes).
+  """
+  #zipfile's own compressor factory keeps the output byte-identical
+  compressor = zipfile._get_compressor(compress_type, compresslevel)
+  crc = 0
+  file_size = 0
+  chunks = []
+  with open(filename, 'rb') as fd:
+    for block in file_blocks(fd, COMPRESS_CHUNK_SIZE):
+      crc = zlib.crc32(block, crc)
+      file_size += len(block)
+      chunks.append(compressor.compress(block) if compressor else bytes(block))
+  if compressor:
+    chunks.append(compressor.flush())
+  return crc & 0xffffffff, file_size, b''.join(chunks)
+
+def _write_compressed(z, zinfo, crc, file_size, data):
+  """Appends an already compressed entry to an open, seekable ZipFile.
+
+  Follows ZipFile.open(zinfo, 'w') and _ZipWriteFile.close, writing the
+  header once with the final sizes instead of patching it afterwards.
+  """
+  zinfo.CRC = crc
+  zinfo.file_size = file_size
+  zinfo.compress_size = len(data)
+  zinfo.flag_bits = 0x00
+  if zinfo.compress_type == zipfile.ZIP_LZMA:
+    zinfo.flag_bits |= 0x02
+  if not zinfo.external_attr:
+    zinfo.external_attr = 0o600 << 16
+
+  zip64 = z._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+
+  z.fp.seek(z.start_dir)
+  zinfo.header_offset = z.fp.tell()
+  z._writecheck(zinfo)
+  z._didModify = True
+  z.fp.write(zinfo.FileHeader(zip64))
+  z.fp.write(data)
+  z.start_dir = z.fp.tell()
+
+  z.filelist.append(zinfo)
+  z.NameToInfo[zinfo.filename] = zinfo
+
+def _use_parallel(planned, workers):
+  if workers == 1 or len(planned) < PARALLEL_MIN_FILES or not zip_internals_available():
+    return False
+  return sum(os.path.getsize(e.filename) for e in planned) >= PARALLEL_MIN_BYTES
+
+def _write_file(z, entry, guard):
+  """Same output as ZipFile.write, checking the size guard as data is written."""
+  with open(entry.filename, 'rb') as src, z.open(_zipinfo(entry), 'w') as dst:
+    for block in file_blocks(src, COMPRESS_CHUNK_SIZE):
+      dst.write(block)
+      guard.check(z.fp.tell())
+
+def write_zip(zipfilename, entries, compression = zipfile.ZIP_STORED, workers = 1, max_zip_size = None):
+  """Writes (filename, archive name) entries to zipfilename.
+
+  compression is a zipfile constant or a CompressionPolicy.  With
+  workers other than 1 (None means one per core), entries are compressed
+  in a process pool and written back in their original order, so the
+  archive is byte-identical to the serial one.  Small inputs, and any
+  input on a Python whose zipfile lacks the internals this needs, are
+  written serially.  If max_zip_size is given, writing stops as soon as
+  the archive is certain to exceed it.
+  """
+  planned = plan_entries(entries, compression)
+  guard = SizeGuard(planned, max_zip_size)
+  guard.check(0)
+
+  with zipfile.ZipFile(zipfilename, 'w') as z:
+    if not _use_parallel(planned, workers):
+      for entry in planned:
+        guard.start_entry()
+        _write_file(z, entry, guard)
+      return
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+      window = (workers or os.cpu_count() or 1) * 2
+      pending = deque()
+      try:
+        for entry in planned:
+          future = pool.submit(_compress_file, entry.filename, entry.compress_type, entry.compresslevel)
+          pending.append((entry, future))
+          if len(pending) >= window:
+            _write_pending(z, pending.popleft(), guard)
+        while pending:
+          _write_pending(z, pending.popleft(), guard)
+      except ValueError:
+        for _, future in pending:
+          future.cancel()
+        raise
+
+def _write_pending(z, item, guard):
+  entry, future = item
+  crc, file_size, data = future.result()
+  guard.start_entry()
+  _write_compressed(z, _zipinfo(entry), crc, file_size, data)
+  guard.check(z.fp.tell())
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+
+from .archive import SizeGuard, file_digest, write_zip, zip_internals_available
+from .archive import _compress_file, _write_compressed, _zipinfo
+from .sessionbuilder import default_app_data_dir
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+def default_cache_dir():
+  return os.path.join(default_app_data_dir(), 'archive_cache')
+
+class ArchiveCache(object):
+  """On-disk cache of built submission archives and their compressed entries.
+
+  Every file is fingerprinted by (path, size, mtime_ns, sha256); the hash
+  is only recomputed when the size or mtime changes.  An archive whose
+  fingerprints all match a cached one is copied instead of rebuilt.
+  Otherwise the archive is rebuilt from cached compressed entries, and
+  only new or changed files are compressed again.  Items are evicted
+  least recently used first once the cache holds more than max_bytes.
+  """
+  def __init__(self, path = None, max_bytes = DEFAULT_MAX_BYTES):
+    self.path = path or default_cache_dir()
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self._index = None
+
+  @property
+  def index(self):
+    if self._index is None:
+      try:
+        with open(os.path.join(self.path, 'index.json'), 'r') as fd:
+          self._index = json.load(fd)
+      except (IOError, ValueError):
+        self._index = {'fingerprints': {}, 'items': {}}
+    return self._index
+
+  def save(self):
+    try:
+      os.makedirs(self.path)
+    except OSError:
+      if not os.path.isdir(self.path):
+        raise
+
+    tmp = os.path.join(self.path, 'index.json.tmp')
+    with open(tmp, 'w') as fd:
+      json.dump(self.index, fd)
+    os.replace(tmp, os.path.join(self.path, 'index.json'))
+
+  def item_path(self, key):
+    return os.path.join(self.path, 'items', key)
+
+  def fingerprint(self, filename):
+    abspath = os.path.abspath(filename)
+    st = os.stat(abspath)
+    known = self.index['fingerprints'].get(abspath)
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+      digest = known[2]
+    else:
+      digest = file_digest(abspath)
+      self.index['fingerprints'][abspath] = [st.st_size, st.st_mtime_ns, digest]
+    return [abspath, st.st_size, st.st_mtime_ns, st.st_mode, digest]
+
+  def _entry_key(self, entry, fingerprint):
+    return 'e-%s-%d-%s' % (fingerprint[4], entry.compress_type, entry.compresslevel)
+
+  def _archive_key(self, planned, fingerprints):
+    description = [[e.arcname, e.compress_type, e.compresslevel] + fp
+                   for e, fp in zip(planned, fingerprints)]
+    return 'a-' + hashlib.sha256(json.dumps(description).encode('utf-8')).hexdigest()
+
+  def _lookup(self, key):
+    item = self.index['items'].get(key)
+    if item is None or not os.path.isfile(self.item_path(key)):
+      return None
+    item['used'] = time.time()
+    return item
+
+  def _store(self, key, data = None, source = None, **meta):
+    try:
+      os.makedirs(os.path.join(self.path, 'items'))
+    except OSError:
+      if not os.path.isdir(os.path.join(self.path, 'items')):
+        raise
+
+    if source is not None:
+      shutil.copyfile(source, self.item_path(key))
+    else:
+      with open(self.item_path(key), 'wb') as fd:
+        fd.write(data)
+
+    meta.update({'size': os.path.getsize(self.item_path(key)), 'used': time.time()})
+    self.index['items'][key] = meta
+
+  def evict(self):
+    items = self.index['items']
+    total = sum(item['size'] for item in items.values())
+    for key in sorted(items, key=lambda k: items[k]['used']):
+      if total <= self.max_bytes:
+        break
+      total -= items.pop(key)['size']
+      try:
+        os.unlink(self.item_path(key))
+      except OSError:
+        pass
+
+  def build(self, zipfilename, planned, max_zip_size = None):
+    """Writes the planned entries to zipfilename, reusing cached work.
+
+    Returns True if the whole archive came from the cache.
+    """
+    fingerprints = [self.fingerprint(e.filename) for e in planned]
+    akey = self._archive_key(planned, fingerprints)
+
+    if self._lookup(akey) is not None:
+      shutil.copyfile(self.item_path(akey), zipfilename)
+      self.hits += 1
+      self.save()
+      return True
+
+    self.misses += 1
+    guard = SizeGuard(planned, max_zip_size)
+    guard.check(0)
+
+    try:
+      #Entries can only be reused through zipfile's internals
+      if not zip_internals_available():
+        write_zip(zipfilename, planned, max_zip_size = max_zip_size)
+      else:
+        self._build_from_entries(zipfilename, planned, fingerprints, guard)
+
+      if max_zip_size is None or os.path.getsize(zipfilename) <= max_zip_size:
+        self._store(akey, source=zipfilename)
+    finally:
+      self.evict()
+      self.save()
+
+    return False
+
+  def _build_from_entries(self, zipfilename, planned, fingerprints, guard):
+    with zipfile.ZipFile(zipfilename, 'w') as z:
+      for entry, fp in zip(planned, fingerprints):
+        guard.start_entry()
+
+        ekey = self._entry_key(entry, fp)
+        item = self._lookup(ekey)
+        if item is not None:
+          with open(self.item_path(ekey), 'rb') as fd:
+            data = fd.read()
+          crc, file_size = item['crc'], item['file_size']
+        else:
+          crc, file_size, data = _compress_file(entry.filename, entry.compress_type, entry.compresslevel)
+          self._store(ekey, data, crc=crc, file_size=file_size)
+
+        _write_compressed(z, _zipinfo(entry), crc, file_size, data)
+        guard.check(z.fp.tell())
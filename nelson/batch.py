@@ -0,0 +1,191 @@
+#Runs many submissions at once, e.g. to regrade reference solutions.
+#
+#A manifest is a json file of the form
+#
+#  {"submissions": [
+#     {"gtcode": "cs6200", "quiz": "pr1", "files": ["server.c", "client.c"]},
+#     {"nanodegree": "nd009", "project": "p1", "files": ["solution.py"], "root": "p1"}
+#  ]}
+#
+#Entries with a gtcode and quiz go to GTOMSCS, those with a nanodegree and
+#project go to Udacity.  files are relative to root, which defaults to the
+#manifest's directory.  Any other key of an entry (max_zip_size,
+#incremental, dedupe, ...) is passed on to the Submission.
+
+import os
+import json
+import time
+import heapq
+import shutil
+import tempfile
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .polling import PollScheduler
+from . import gtomscs, udacity
+
+PHASES = ['zip', 'upload', 'wait']
+
+def load_manifest(path):
+  with open(path, 'r') as fd:
+    manifest = json.load(fd)
+
+  base = os.path.dirname(os.path.abspath(path))
+  entries = []
+  for entry in manifest['submissions']:
+    entry = dict(entry)
+    if 'gtcode' in entry and 'quiz' in entry:
+      entry['kind'] = 'gtomscs'
+    elif 'nanodegree' in entry and 'project' in entry:
+      entry['kind'] = 'udacity'
+    else:
+      raise ValueError("Manifest entries need a gtcode and quiz or a nanodegree and project: %s" % json.dumps(entry))
+    if not entry.get('files'):
+      raise ValueError("Manifest entry has no files: %s" % json.dumps(entry))
+    entry['root'] = os.path.join(base, entry.get('root', ''))
+    entries.append(entry)
+
+  return entries
+
+def entry_name(entry):
+  if entry['kind'] == 'gtomscs':
+    return '%s/%s' % (entry['gtcode'], entry['quiz'])
+  return '%s/%s' % (entry['nanodegree'], entry['project'])
+
+def build_submissions(entries, sessions, environment = 'production'):
+  """Creates a (name, Submission) pair per manifest entry.
+
+  sessions maps 'gtomscs' and 'udacity' to the authenticated session that
+  all submissions of that kind share.
+  """
+  submissions = []
+  for entry in entries:
+    kwargs = dict((k, v) for k, v in entry.items()
+                  if k not in ['kind', 'gtcode', 'quiz', 'nanodegree', 'project', 'files', 'root'])
+    kwargs.setdefault('environment', environment)
+    filenames = [os.path.join(entry['root'], f) for f in entry['files']]
+
+    if entry['kind'] == 'gtomscs':
+      s = gtomscs.Submission(entry['gtcode'], entry['quiz'], sessions['gtomscs'], filenames,
+                             zipfile_root = entry['root'], **kwargs)
+    else:
+      s = udacity.Submission(entry['nanodegree'], entry['project'], sessions['udacity'], filenames,
+                             zipfile_root = entry['root'], **kwargs)
+    submissions.append((entry_name(entry), s))
+
+  return submissions
+
+class BatchItem(object):
+  """One submission in a batch, with its timings and outcome."""
+  def __init__(self, name, submission, scheduler):
+    self.name = name
+    self.submission = submission
+    self.scheduler = scheduler
+    self.timings = {}
+    self.status = 'pending'
+    self.error = None
+    self.uploaded_at = None
+
+  def upload(self):
+    start = time.time()
+    self.submission.prepare()
+    zipped = time.time()
+    self.submission.submit()
+    self.uploaded_at = time.time()
+
+    self.timings['zip'] = zipped - start
+    self.timings['upload'] = self.uploaded_at - zipped
+
+  def poll(self):
+    return self.submission.poll()
+
+  def next_delay(self):
+    return self.scheduler.next_delay(self.submission.retry_after, self.submission.eta())
+
+  def finish(self):
+    self.timings['wait'] = time.time() - self.uploaded_at
+    self.status = 'graded' if self.submission.feedback() is not None else 'error'
+
+  def fail(self, phase, exception):
+    self.status = 'failed'
+    self.error = "%s: %s" % (phase, exception)
+
+  def report(self):
+    ans = {'name': self.name,
+           'status': self.status,
+           'timings': self.timings,
+           'poll_count': self.submission.poll_count}
+
+    if self.status in ['graded', 'error']:
+      ans['feedback'] = self.submission.feedback()
+      ans['error_report'] = self.submission.error_report()
+    elif self.error:
+      ans['error'] = self.error
+
+    return ans
+
+def run_batch(submissions, workers = 4, refresh_time = 3, scheduler_factory = None):
+  """Submits every (name, Submission) pair and waits for all the results.
+
+  Archives are built and uploaded by a pool of workers threads, and
+  each submission is polled on its own PollScheduler as soon as its
+  upload finishes.  Polls go through the same pool, so at most workers
+  requests are in flight at once however many submissions are waiting.
+  A failure only affects its own submission.  Returns the consolidated
+  report.
+  """
+  scheduler_factory = scheduler_factory or (lambda: PollScheduler(initial = refresh_time))
+  items = [BatchItem(name, s, scheduler_factory()) for name, s in submissions]
+
+  #Each submission gets its own archive so that concurrent builds don't collide
+  tmp = tempfile.mkdtemp(prefix = 'nelson-batch-')
+  for i, item in enumerate(items):
+    item.submission.zipfilename = os.path.join(tmp, '%d.zip' % i)
+
+  started = time.time()
+  try:
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+      running = dict((pool.submit(item.upload), ('upload', item)) for item in items)
+      waiting = []
+
+      while running or waiting:
+        now = time.time()
+        while waiting and waiting[0][0] <= now:
+          _, _, item = heapq.heappop(waiting)
+          running[pool.submit(item.poll)] = ('poll', item)
+
+        timeout = max(0., waiting[0][0] - now) if waiting else None
+        if not running:
+          time.sleep(timeout)
+          continue
+
+        done, _ = wait(running, timeout = timeout, return_when = FIRST_COMPLETED)
+        for f in done:
+          phase, item = running.pop(f)
+          try:
+            finished = f.result()
+          except Exception as e:
+            item.fail(phase, e)
+            continue
+
+          if phase == 'poll' and finished:
+            item.finish()
+          else:
+            #Poll right after the upload, as submit() does
+            delay = 0. if phase == 'upload' else item.next_delay()
+            heapq.heappush(waiting, (time.time() + delay, id(item), item))
+  finally:
+    shutil.rmtree(tmp, ignore_errors = True)
+
+  results = [item.report() for item in items]
+  return {'started_at': "{:%Y-%m-%dT%H:%M:%S}".format(datetime.datetime.fromtimestamp(started)),
+          'elapsed': time.time() - started,
+          'workers': workers,
+          'counts': dict((status, sum(1 for r in results if r['status'] == status))
+                         for status in ['graded', 'error', 'failed']),
+          'timings': dict((phase, sum(r['timings'].get(phase, 0.) for r in results)) for phase in PHASES),
+          'results': results}
+
+def write_report(report, filename):
+  with open(filename, 'w') as fd:
+    json.dump(report, fd, indent=4, separators=(',', ': '))
@@ -0,0 +1,9 @@
+import run
+
+#Run by nelson on the student's machine before uploading.  Keep it to the
+#checks that are fast and catch the most common mistakes.
+def main():
+  run.grade([run.HWCompilationTest])
+
+if __name__ == '__main__':
+  main()
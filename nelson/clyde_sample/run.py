@@ -72,15 +72,14 @@ class HWExecutionTest(HWTest):
 
     self.assertEqual(output.rstrip() , "Hello World!")
 
-def main():
+def grade(test_cases):
     cwd = os.getcwd()
 
     os.chdir('workspace')
 
-    compilation_test_suite = unittest.TestLoader().loadTestsFromTestCase(HWCompilationTest)
-    execution_test_suite = unittest.TestLoader().loadTestsFromTestCase(HWExecutionTest)
+    suites = [unittest.TestLoader().loadTestsFromTestCase(test_case) for test_case in test_cases]
 
-    test_result = unittest.TextTestRunner(resultclass=MyResult).run(unittest.TestSuite([compilation_test_suite, execution_test_suite]))
+    test_result = unittest.TextTestRunner(resultclass=MyResult).run(unittest.TestSuite(suites))
     all_tests = test_result.tests()
 
     data = {'total_points_available': sum( (x[0].result.get('points_available') or 0) for x in all_tests),
@@ -94,5 +93,8 @@ def main():
 
     os.chdir(cwd)
 
+def main():
+    grade([HWCompilationTest, HWExecutionTest])
+
 if __name__ == '__main__':
   main()
@@ -0,0 +1,92 @@
+import os
+import math
+import zipfile
+from collections import namedtuple, Counter
+
+#Formats whose contents are already compressed; deflating them again costs
+#CPU and rarely saves a byte
+COMPRESSED_EXTENSIONS = frozenset([
+  '.7z', '.bz2', '.gz', '.tgz', '.xz', '.lz4', '.zst', '.zip', '.jar', '.war', '.whl', '.egg',
+  '.npz', '.pt', '.pth', '.ckpt', '.h5', '.hdf5', '.pb', '.tflite', '.onnx',
+  '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.mp4', '.mov', '.avi', '.ogg', '.flac',
+  '.docx', '.xlsx', '.pptx', '.pdf',
+])
+
+PROBE_SIZE = 4 << 10
+
+#Entries as they will be written: where to read them from, what to call
+#them in the archive and how to compress them
+PlannedEntry = namedtuple('PlannedEntry', ['filename', 'arcname', 'compress_type', 'compresslevel'])
+
+def byte_entropy(data):
+  """Shannon entropy of data in bits per byte, from 0 (constant) to 8 (random)."""
+  if not data:
+    return 0.
+  total = float(len(data))
+  return -sum(n / total * math.log(n / total, 2) for n in Counter(bytearray(data)).values())
+
+class CompressionPolicy(object):
+  """Decides how each file in a submission is compressed.
+
+  Subclasses implement choose(), returning a (compress_type,
+  compresslevel) pair suitable for zipfile.ZipFile.write.
+  """
+  def choose(self, filename):
+    raise NotImplementedError()
+
+  def plan(self, entries):
+    return [PlannedEntry(f, zpath, *self.choose(f)) for f, zpath in entries]
+
+class UniformPolicy(CompressionPolicy):
+  """Compresses every file the same way."""
+  def __init__(self, compress_type = zipfile.ZIP_STORED, compresslevel = None):
+    self.compress_type = compress_type
+    self.compresslevel = compresslevel
+
+  def choose(self, filename):
+    return self.compress_type, self.compresslevel
+
+class AdaptivePolicy(CompressionPolicy):
+  """Stores files that won't shrink and deflates the rest.
+
+  A file is stored when its extension names a compressed format or when
+  the first probe_size bytes look random (entropy above
+  entropy_threshold bits per byte).  Compressible files of at least
+  strong_min_size bytes use strong_compress_type (e.g. zipfile.ZIP_LZMA)
+  if one is given, trading CPU for a better ratio; only enable it when
+  the receiving side can unpack that method.
+  """
+  def __init__(self,
+               compresslevel = 6,
+               stored_extensions = COMPRESSED_EXTENSIONS,
+               probe_size = PROBE_SIZE,
+               entropy_threshold = 7.5,
+               strong_compress_type = None,
+               strong_min_size = 1 << 20):
+    self.compresslevel = compresslevel
+    self.stored_extensions = frozenset(stored_extensions)
+    self.probe_size = probe_size
+    self.entropy_threshold = entropy_threshold
+    self.strong_compress_type = strong_compress_type
+    self.strong_min_size = strong_min_size
+
+  def choose(self, filename):
+    if os.path.splitext(filename)[1].lower() in self.stored_extensions:
+      return zipfile.ZIP_STORED, None
+
+    with open(filename, 'rb') as fd:
+      head = fd.read(self.probe_size)
+
+    if not head or byte_entropy(head) > self.entropy_threshold:
+      return zipfile.ZIP_STORED, None
+
+    if self.strong_compress_type is not None and os.path.getsize(filename) >= self.strong_min_size:
+      return self.strong_compress_type, None
+
+    return zipfile.ZIP_DEFLATED, self.compresslevel
+
+def as_policy(compression):
+  """Accepts either a CompressionPolicy or a zipfile compression constant."""
+  if isinstance(compression, CompressionPolicy):
+    return compression
+  return UniformPolicy(compression)
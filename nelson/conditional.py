@@ -0,0 +1,67 @@
+import os
+import json
+import errno
+
+#Conditional GETs: the ETag and Last-Modified of a response are sent back
+#as If-None-Match and If-Modified-Since, and a 304 means the resource has
+#not changed since.
+
+def response_validators(r):
+  """The validators a response carries, as a dict that may be empty."""
+  validators = {}
+  if r.headers.get('ETag'):
+    validators['etag'] = r.headers['ETag']
+  if r.headers.get('Last-Modified'):
+    validators['last_modified'] = r.headers['Last-Modified']
+  return validators
+
+def conditional_headers(validators):
+  headers = {}
+  if validators.get('etag'):
+    headers['If-None-Match'] = validators['etag']
+  if validators.get('last_modified'):
+    headers['If-Modified-Since'] = validators['last_modified']
+  return headers
+
+class ResponseCache(object):
+  """JSON documents fetched with GET, kept with their validators in a json file.
+
+  get() revalidates a cached document instead of downloading it again,
+  so an unchanged resource costs a 304 with no body.  Documents served
+  without validators are not kept.
+  """
+  def __init__(self, path):
+    self.path = path
+    try:
+      with open(path, 'r') as fd:
+        self.entries = json.load(fd)
+    except (IOError, ValueError):
+      self.entries = {}
+
+  def get(self, session, url):
+    entry = self.entries.get(url)
+    r = session.get(url, headers = conditional_headers(entry or {}))
+
+    if r.status_code == 304 and entry is not None:
+      return entry['body']
+
+    r.raise_for_status()
+    body = r.json()
+
+    validators = response_validators(r)
+    if validators:
+      validators['body'] = body
+      self.entries[url] = validators
+      self.save()
+
+    return body
+
+  def save(self):
+    try:
+      os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+    except OSError as exception:
+      if exception.errno != errno.EEXIST:
+        raise
+
+    with open(self.path, 'w') as fd:
+      json.dump(self.entries, fd)
@@ -1,24 +1,31 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-from future import standard_library
-standard_library.install_aliases()
-from builtins import input
-from builtins import object
-
 import os
 import sys
 import shutil
 import stat
 import argparse
 import errno
-import requests
 import json
+import datetime
 import subprocess as sp
-from pkg_resources import Requirement, resource_filename
-from .gtomscs import build_session as build_gtomscs_session
-from .udacity import build_session as build_udacity_session
 
-from .gtomscs import root_url as gtomscs_root_url
-from .udacity import root_url as udacity_root_url
+#requests, pkg_resources and the service modules are imported where they
+#are used, so that `nelson --help` and argument errors start up quickly.
+
+def build_gtomscs_session(*args):
+  from .gtomscs import build_session
+  return build_session(*args)
+
+def build_udacity_session(*args):
+  from .udacity import build_session
+  return build_session(*args)
+
+def gtomscs_root_url(environment):
+  from .gtomscs import root_url
+  return root_url(environment)
+
+def udacity_root_url(environment):
+  from .udacity import root_url
+  return root_url(environment)
 
 def safe_mkdirs(path):
   try:
@@ -65,6 +72,8 @@ def infer_git_url(remote):
   return ans
 
 def create_files(name):
+  from pkg_resources import Requirement, resource_filename
+
   src = os.path.dirname(resource_filename(Requirement.parse("nelson"),"/nelson/clyde_sample/run.py"))
 
   dst = os.path.join('app', name)
@@ -89,6 +98,7 @@ class CDHelper(object):
     self.environment = args.environment
     self.id_provider = args.id_provider
     self.jwt_path = args.jwt_path
+    self.compress_requests = getattr(args, 'compress_requests', False)
 
   def act(self):
     if self.action == 'get':
@@ -174,11 +184,13 @@ class CDHelper(object):
     url = self.update_url(data)
 
     http = self.build_session()
-    r = http.get(url)
 
-    r.raise_for_status()
+    from .conditional import ResponseCache
+    from .sessionbuilder import default_app_data_dir
 
-    return r.json()
+    #Revalidates what an earlier get fetched rather than downloading it again
+    cache = ResponseCache(os.path.join(default_app_data_dir(), 'response_cache.json'))
+    return cache.get(http, url)
 
 class CourseHelper(CDHelper):
 
@@ -199,7 +211,7 @@ class CourseHelper(CDHelper):
     return frozenset(_ for _ in data) - {'gtcode', 'title', 'cd_group_id', 'git_url', 'deploy_key'}
 
   def build_session(self):
-    return build_gtomscs_session(self.environment, self.id_provider, self.jwt_path)
+    return build_gtomscs_session(self.environment, self.id_provider, self.jwt_path, self.compress_requests)
 
   def create_url(self, data):
     return self.root_url + '/courses'
@@ -246,7 +258,7 @@ class NanodegreeHelper(CDHelper):
     return frozenset(_ for _ in data) - {'ndkey', 'name', 'cd_group_id', 'git_url', 'deploy_key'}
 
   def build_session(self):
-    return build_udacity_session(self.environment, self.id_provider, self.jwt_path)
+    return build_udacity_session(self.environment, self.id_provider, self.jwt_path, self.compress_requests)
 
   def create_url(self, data):
     return self.root_url + '/nanodegrees'
@@ -289,7 +301,7 @@ class QuizHelper(CDHelper):
                                          'quota_window', 'active'}
 
   def build_session(self):
-    return build_gtomscs_session(self.environment, self.id_provider, self.jwt_path)
+    return build_gtomscs_session(self.environment, self.id_provider, self.jwt_path, self.compress_requests)
 
   def create_url(self, data):
     return self.root_url + '/courses/' + data['gtcode'] + '/quizzes'
@@ -334,7 +346,7 @@ class ProjectHelper(CDHelper):
                                          'quota_window', 'active'}
 
   def build_session(self):
-    return build_udacity_session(self.environment, self.id_provider, self.jwt_path)
+    return build_udacity_session(self.environment, self.id_provider, self.jwt_path, self.compress_requests)
 
   def create_url(self, data):
     return self.root_url + '/nanodegrees/' + data['ndkey'] + '/projects'
@@ -352,8 +364,39 @@ class ProjectHelper(CDHelper):
 
     return ans
 
+def batch(args):
+  from .batch import load_manifest, build_submissions, run_batch, write_report
+  from .sessionbuilder import debug_connection_stats
+
+  entries = load_manifest(args.manifest)
+  kinds = set(entry['kind'] for entry in entries)
+
+  #One authenticated session per service, shared by all of its submissions
+  sessions = {}
+  if 'gtomscs' in kinds:
+    sessions['gtomscs'] = build_gtomscs_session(args.environment, args.id_provider, args.jwt_path, args.compress_requests)
+  if 'udacity' in kinds:
+    sessions['udacity'] = build_udacity_session(args.environment, args.id_provider, args.jwt_path, args.compress_requests)
+
+  report = run_batch(build_submissions(entries, sessions, args.environment),
+                     workers = args.workers,
+                     refresh_time = args.refresh_time)
+
+  for session in sessions.values():
+    debug_connection_stats(session)
+
+  filename = args.output or "batch-results-{:%Y-%m-%d-%H-%M-%S}.json".format(datetime.datetime.now())
+  write_report(report, filename)
+
+  return {'results_file': filename,
+          'elapsed': report['elapsed'],
+          'counts': report['counts'],
+          'timings': report['timings']}
+
 def main(args):
-  if args.object == 'course':
+  if args.action == 'batch':
+    return batch(args)
+  elif args.object == 'course':
     return CourseHelper(args).act()
   elif args.object == 'nanodegree':
     return NanodegreeHelper(args).act()
@@ -367,6 +410,7 @@ def main_func():
   parser.add_argument('--environment', default='production', help="webserver environment")
   parser.add_argument('--id_provider', default='udacity', help="identity provider (gt for OMSCS TAs)")
   parser.add_argument('--jwt_path', default=None, help="path to file containing auth information")
+  parser.add_argument('--compress_requests', action='store_true', help="gzip large json request bodies")
 
   subparsers = parser.add_subparsers(dest="action", help="Action")
 
@@ -382,6 +426,12 @@ def main_func():
   update_parser.add_argument('object', choices = ['course', 'nanodegree', 'quiz', 'project'], help="what type to act upon") 
   update_parser.add_argument('data_file', help="json file containing configuration")
 
+  batch_parser = subparsers.add_parser("batch")
+  batch_parser.add_argument('manifest', help="json file listing the submissions to make")
+  batch_parser.add_argument('--workers', type=int, default=4, help="number of submissions zipped, uploaded or polled at once")
+  batch_parser.add_argument('--refresh_time', type=float, default=3, help="initial seconds between polls")
+  batch_parser.add_argument('--output', default=None, help="results file (default batch-results-<timestamp>.json)")
+
   args = parser.parse_args()
 
   obj = main(args)
@@ -0,0 +1,30 @@
+#Server-sent events (text/event-stream), as used for pushing submission
+#results.  The server sends the submission document in a 'status' event
+#whenever it changes and closes the stream once grading is done; lines
+#starting with ':' are keepalives.
+
+EVENT_STREAM_TYPE = 'text/event-stream'
+
+def iter_events(lines):
+  """Yields (event, data) pairs from the decoded lines of an event stream."""
+  event, data = 'message', []
+  for line in lines:
+    if line == '':
+      if data:
+        yield event, '\n'.join(data)
+      event, data = 'message', []
+    elif line.startswith(':'):
+      continue
+    else:
+      field, _, value = line.partition(':')
+      if value.startswith(' '):
+        value = value[1:]
+      if field == 'event':
+        event = value
+      elif field == 'data':
+        data.append(value)
+
+def format_event(event, data):
+  """Encodes one event for the wire."""
+  lines = ['event: %s' % event] + ['data: %s' % line for line in data.split('\n')]
+  return ('\n'.join(lines) + '\n\n').encode('utf-8')
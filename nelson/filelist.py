@@ -0,0 +1,142 @@
+import os
+import re
+import glob
+
+#Directories and files that never belong in a submission
+DEFAULT_EXCLUDES = [
+  '.git/', '.hg/', '.svn/', 'node_modules/', '__pycache__/', '.ipynb_checkpoints/',
+  'build/', 'dist/', '*.egg-info/', '.tox/', '.venv/', 'venv/',
+  '*.pyc', '*.pyo', '*.o', '.DS_Store',
+]
+
+def _translate(pattern):
+  """Turns a .gitignore-style glob into a regular expression over '/'-separated paths."""
+  out = []
+  i = 0
+  while i < len(pattern):
+    if pattern.startswith('**/', i):
+      out.append('(?:.*/)?')
+      i += 3
+    elif pattern.startswith('**', i):
+      out.append('.*')
+      i += 2
+    elif pattern[i] == '*':
+      out.append('[^/]*')
+      i += 1
+    elif pattern[i] == '?':
+      out.append('[^/]')
+      i += 1
+    elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+      j = pattern.index(']', i + 1)
+      body = pattern[i + 1:j]
+      if body.startswith('!'):
+        body = '^' + body[1:]
+      out.append('[%s]' % body.replace('\\', '\\\\'))
+      i = j + 1
+    else:
+      out.append(re.escape(pattern[i]))
+      i += 1
+  return ''.join(out)
+
+class IgnoreRules(object):
+  """A list of .gitignore-style patterns.
+
+  Supports '*', '?', '[...]' and '**', a trailing '/' for directories
+  only, a leading '!' to re-include, and a leading or inner '/' to anchor
+  a pattern to the directory being walked.  As with git, the last
+  matching pattern wins.
+  """
+  def __init__(self, patterns):
+    self.rules = []
+    for pattern in patterns:
+      pattern = pattern.strip()
+      if not pattern or pattern.startswith('#'):
+        continue
+
+      negate = pattern.startswith('!')
+      pattern = pattern.lstrip('!')
+      dir_only = pattern.endswith('/')
+      pattern = pattern.rstrip('/')
+
+      if '/' in pattern:
+        regex = _translate(pattern.lstrip('/'))
+      else:
+        regex = '(?:.*/)?' + _translate(pattern)
+
+      self.rules.append((negate, dir_only, re.compile(regex + '$')))
+
+  def ignored(self, relpath, is_dir):
+    result = False
+    for negate, dir_only, regex in self.rules:
+      if dir_only and not is_dir:
+        continue
+      if regex.match(relpath):
+        result = not negate
+    return result
+
+  def ignored_path(self, relpath, is_dir):
+    """Like ignored(), but also true when any parent directory is ignored."""
+    parts = relpath.split('/')
+    for i in range(1, len(parts)):
+      if self.ignored('/'.join(parts[:i]), True):
+        return True
+    return self.ignored(relpath, is_dir)
+
+def walk(directory, rules):
+  """Yields the files under directory in sorted order, pruning ignored directories.
+
+  Symbolic links are skipped, whether to directories or to files, so
+  everything yielded stays inside directory.  A linked file can still be
+  submitted by naming it explicitly.
+  """
+  def visit(path, relpath):
+    with os.scandir(path) as it:
+      entries = sorted(it, key=lambda e: e.name)
+
+    for entry in entries:
+      rel = relpath + '/' + entry.name if relpath else entry.name
+      is_dir = entry.is_dir(follow_symlinks=False)
+      if rules.ignored(rel, is_dir):
+        continue
+      if is_dir:
+        for f in visit(entry.path, rel):
+          yield f
+      elif entry.is_file(follow_symlinks=False):
+        yield entry.path
+
+  return visit(directory, '')
+
+def expand_filenames(filenames, excludes = None):
+  """Expands directories and glob patterns in filenames into a list of files.
+
+  Names of existing files are kept as given, even if they match an
+  exclude or contain glob characters (e.g. 'sol[1].py').  Directories are
+  walked and glob matches are filtered by excludes (DEFAULT_EXCLUDES if
+  None).  A pattern that matches nothing raises ValueError.  Duplicates
+  are dropped, keeping the first.
+  """
+  rules = IgnoreRules(DEFAULT_EXCLUDES if excludes is None else excludes)
+
+  expanded = []
+  for name in filenames:
+    if os.path.isdir(name):
+      expanded.extend(walk(name, rules))
+    elif os.path.exists(name):
+      expanded.append(name)
+    elif glob.has_magic(name):
+      matches = sorted(glob.glob(name, recursive=True))
+      if not matches:
+        raise ValueError("No files match %s." % name)
+      for match in matches:
+        is_dir = os.path.isdir(match)
+        if rules.ignored_path(os.path.normpath(match).replace(os.sep, '/'), is_dir):
+          continue
+        if is_dir:
+          expanded.extend(walk(match, rules))
+        else:
+          expanded.append(match)
+    else:
+      expanded.append(name)
+
+  seen = set()
+  return [f for f in expanded if not (f in seen or seen.add(f))]
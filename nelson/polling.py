@@ -0,0 +1,45 @@
+import time
+import random
+from email.utils import parsedate_tz, mktime_tz
+
+def parse_retry_after(value):
+  """Seconds to wait from a Retry-After header, which is either seconds or an HTTP date."""
+  if value is None:
+    return None
+  value = value.strip()
+  if value.isdigit():
+    return float(value)
+  parsed = parsedate_tz(value)
+  if parsed is None:
+    return None
+  return max(0., mktime_tz(parsed) - time.time())
+
+class PollScheduler(object):
+  """Decides how long to wait before each poll.
+
+  Waits start at initial seconds and grow by factor up to max_interval,
+  each randomly stretched or shrunk by up to jitter (a fraction) so that
+  clients that submitted together drift apart.  When the server
+  estimates the seconds until the result is ready, the wait is that
+  estimate (capped at max_interval); a Retry-After from the server is
+  always honored as a minimum.
+  """
+  def __init__(self, initial = 3., factor = 1.5, max_interval = 60., jitter = 0.2, rng = random.random):
+    self.initial = initial
+    self.factor = factor
+    self.max_interval = max_interval
+    self.jitter = jitter
+    self.rng = rng
+    self.interval = initial
+
+  def next_delay(self, retry_after = None, eta = None):
+    if eta is not None and eta > 0:
+      delay = min(eta, self.max_interval)
+    else:
+      delay = self.interval * (1. + self.jitter * (2. * self.rng() - 1.))
+      self.interval = min(self.interval * self.factor, self.max_interval)
+
+    if retry_after is not None:
+      delay = max(delay, retry_after)
+
+    return delay
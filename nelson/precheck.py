@@ -0,0 +1,125 @@
+#Local pre-grading: a fast subset of the autograder, run on the student's
+#machine before uploading so that obvious failures (doesn't compile, a
+#file is missing) are reported in seconds rather than after a full upload
+#and a wait in the grading queue.
+#
+#It follows the clyde layout (see CDGuide.md).  The course's app directory
+#(e.g. app/lab01, containing precheck.py) is copied to a scratch directory,
+#the submitted files are merged into its workspace/, and
+#
+#  python precheck.py <quiz>
+#
+#is run from there.  Like run.py, the script writes workspace/grade.json:
+#
+#  {"tests": [{"description": ..., "traceback": ..., "output": {"points_available": ..., "points_awarded": ...}}]}
+#
+#The check fails if the script exits with an error or any test has a
+#traceback.
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+from .archive import zip_entries
+
+DEFAULT_TIMEOUT = 30
+PRECHECK_SCRIPT = 'precheck.py'
+GRADE_FILE = os.path.join('workspace', 'grade.json')
+
+class PrecheckFailed(RuntimeError):
+  """The submission failed the local checks.
+
+  feedback is the parsed grade.json (None if the script wrote none) and
+  output what the script printed.
+  """
+  def __init__(self, message, feedback = None, output = ''):
+    super(PrecheckFailed, self).__init__(message)
+    self.feedback = feedback
+    self.output = output
+
+class PrecheckError(RuntimeError):
+  """The checks could not be run to the end (timeout, missing script or interpreter), which says nothing about the submission."""
+  pass
+
+def failed_tests(feedback):
+  return [t for t in (feedback or {}).get('tests', []) if t.get('traceback')]
+
+def format_summary(feedback):
+  """One line per test with its points, as the sample console.py prints them."""
+  lines = []
+  for t in (feedback or {}).get('tests', []):
+    description = '{:70s}'.format((t.get('description') or '')[:69] + ":")
+    output = t.get('output') or {}
+    points = "%d/%d" % (output.get('points_awarded') or 0, output.get('points_available') or 0)
+    lines.append('%s %s' % (description, points.rjust(9)))
+  return '\n'.join(lines)
+
+class Precheck(object):
+  """Runs app_dir's precheck script against a submission's files.
+
+  The script gets timeout seconds; quiz_name is passed as its argument,
+  as the autograder does for run.py.
+  """
+  def __init__(self, app_dir, quiz_name = '', script = PRECHECK_SCRIPT, timeout = DEFAULT_TIMEOUT,
+               python = sys.executable):
+    self.app_dir = app_dir
+    self.quiz_name = quiz_name
+    self.script = script
+    self.timeout = timeout
+    self.python = python
+
+  def run(self, root_path, filenames):
+    """Returns the feedback of a passing check, or raises PrecheckFailed or PrecheckError."""
+    if not os.path.isfile(os.path.join(self.app_dir, self.script)):
+      raise PrecheckError("%s not found in %s" % (self.script, self.app_dir))
+
+    scratch = tempfile.mkdtemp(prefix = 'nelson-precheck-')
+    try:
+      home = os.path.join(scratch, 'home')
+      try:
+        shutil.copytree(self.app_dir, home)
+        self._merge(home, root_path, filenames)
+      except OSError as e:
+        raise PrecheckError("could not copy the files for the local checks: %s" % e)
+
+      try:
+        p = subprocess.run([self.python, self.script] + ([self.quiz_name] if self.quiz_name else []),
+                           cwd = home,
+                           stdout = subprocess.PIPE,
+                           stderr = subprocess.STDOUT,
+                           timeout = self.timeout)
+      except subprocess.TimeoutExpired:
+        raise PrecheckError("local checks did not finish within %s seconds" % self.timeout)
+      except OSError as e:
+        raise PrecheckError("could not start %s: %s" % (self.python, e))
+      output = p.stdout.decode('utf-8', 'replace')
+
+      feedback = self._read_feedback(home)
+      if p.returncode != 0:
+        raise PrecheckFailed("%s exited with status %d" % (self.script, p.returncode), feedback, output)
+
+      failed = failed_tests(feedback)
+      if failed:
+        raise PrecheckFailed("%d of %d local checks failed" % (len(failed), len(feedback['tests'])), feedback, output)
+
+      return feedback
+    finally:
+      shutil.rmtree(scratch, ignore_errors = True)
+
+  def _merge(self, home, root_path, filenames):
+    #Submitted files win over the course's, as on the autograder
+    for filename, arcname in zip_entries(root_path, filenames):
+      destination = os.path.join(home, 'workspace', arcname)
+      if not os.path.isdir(os.path.dirname(destination)):
+        os.makedirs(os.path.dirname(destination))
+      shutil.copy2(filename, destination)
+
+  def _read_feedback(self, home):
+    try:
+      with open(os.path.join(home, GRADE_FILE), 'r') as fd:
+        return json.load(fd)
+    except (IOError, ValueError):
+      return None
@@ -0,0 +1,107 @@
+import os
+import io
+import gzip
+import json
+import datetime
+import itertools
+
+COMPACT_SEPARATORS = (',', ':')
+DEFAULT_MAX_LOG_BYTES = 16 << 20
+DEFAULT_LOG_BACKUPS = 5
+
+def _open_text(filename, mode, compressed):
+  if compressed:
+    return gzip.open(filename, mode + 't', encoding = 'utf-8')
+  return io.open(filename, mode, encoding = 'utf-8')
+
+def log_filename(directory, project_name, compress = False):
+  return os.path.join(directory, "%s-results.jsonl%s" % (project_name, '.gz' if compress else ''))
+
+class ResultWriter(object):
+  """Saves the feedback of each submission.
+
+  By default every result goes to its own <project>-result-<timestamp>.json,
+  written compactly (or with indent) straight to disk, and gzipped as .json.gz
+  if compress is set.  With log=True, results are instead appended as one
+  line each to <project>-results.jsonl, which is rotated once it reaches
+  max_log_bytes, keeping log_backups older files (.1 being the newest).
+  """
+  def __init__(self, directory = '.', compress = False, indent = None,
+               log = False, max_log_bytes = DEFAULT_MAX_LOG_BYTES, log_backups = DEFAULT_LOG_BACKUPS):
+    self.directory = directory
+    self.compress = compress
+    self.indent = indent
+    self.log = log
+    self.max_log_bytes = max_log_bytes
+    self.log_backups = log_backups
+
+  def write(self, project_name, feedback):
+    """Saves feedback and returns the file it went to."""
+    now = datetime.datetime.now()
+    if self.log:
+      return self._append_log(project_name, feedback, now)
+    return self._write_file(project_name, feedback, now)
+
+  def _write_file(self, project_name, feedback, now):
+    filename = os.path.join(self.directory, "%s-result-%s.json%s" % (project_name,
+                                                                    "{:%Y-%m-%d-%H-%M-%S}".format(now),
+                                                                    '.gz' if self.compress else ''))
+    separators = (',', ': ') if self.indent else COMPACT_SEPARATORS
+    with _open_text(filename, 'w', self.compress) as fd:
+      json.dump(feedback, fd, indent = self.indent, separators = separators)
+
+    return filename
+
+  def _append_log(self, project_name, feedback, now):
+    filename = log_filename(self.directory, project_name, self.compress)
+    if os.path.exists(filename) and os.path.getsize(filename) >= self.max_log_bytes:
+      self._rotate(filename)
+
+    record = {'timestamp': "{:%Y-%m-%dT%H:%M:%S}".format(now),
+              'project': project_name,
+              'feedback': feedback}
+
+    #Gzip members can be concatenated, so compressed logs are appended to as well
+    with _open_text(filename, 'a', self.compress) as fd:
+      json.dump(record, fd, separators = COMPACT_SEPARATORS)
+      fd.write('\n')
+
+    return filename
+
+  def _rotate(self, filename):
+    oldest = '%s.%d' % (filename, self.log_backups)
+    if self.log_backups > 0 and os.path.exists(oldest):
+      os.unlink(oldest)
+    for i in range(self.log_backups - 1, 0, -1):
+      if os.path.exists('%s.%d' % (filename, i)):
+        os.rename('%s.%d' % (filename, i), '%s.%d' % (filename, i + 1))
+    if self.log_backups > 0:
+      os.rename(filename, filename + '.1')
+    else:
+      os.unlink(filename)
+
+class ResultLog(object):
+  """Reads back what ResultWriter(log=True) appended, oldest first.
+
+  Records are parsed one line at a time, so paging through a long
+  history never holds more than the requested page in memory.
+  """
+  def __init__(self, project_name, directory = '.', compress = False, backups = DEFAULT_LOG_BACKUPS):
+    self.filename = log_filename(directory, project_name, compress)
+    self.compress = compress
+    self.backups = backups
+
+  def files(self):
+    names = ['%s.%d' % (self.filename, i) for i in range(self.backups, 0, -1)] + [self.filename]
+    return [f for f in names if os.path.exists(f)]
+
+  def __iter__(self):
+    for filename in self.files():
+      with _open_text(filename, 'r', self.compress) as fd:
+        for line in fd:
+          if line.strip():
+            yield json.loads(line)
+
+  def page(self, number, size = 20):
+    """The records on page number (from 0), size per page."""
+    return list(itertools.islice(iter(self), number * size, (number + 1) * size))
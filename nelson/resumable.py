@@ -0,0 +1,102 @@
+import os
+import time
+import hashlib
+import requests
+
+from .archive import file_digest
+
+#Resumable upload protocol, relative to a submission url:
+#
+#  POST <url>/uploads                 {"size", "sha256", "chunk_size"} -> {"id", "offset"}
+#  GET  <url>/uploads/<id>            -> {"offset"}
+#  PUT  <url>/uploads/<id>            one chunk, with Content-Range and X-Chunk-Sha256
+#                                     -> {"offset"}; 409 with {"offset"} if out of place,
+#                                        400 if the checksum doesn't match
+#  POST <url>/uploads/<id>/complete   -> the submission, once all bytes are in
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+class UploadError(RuntimeError):
+  pass
+
+class ChunkedUploader(object):
+  """Uploads a file in checksummed chunks, resuming from the server's offset after failures.
+
+  Each failed chunk (connection error, timeout, 5xx or checksum mismatch)
+  is retried up to max_retries times in a row, waiting retry_delay
+  seconds, doubled on every consecutive failure.  progress is an
+  UploadProgress whose bytes_read follows the server's offset.
+  """
+  def __init__(self, session, url, filename, progress,
+               chunk_size = DEFAULT_CHUNK_SIZE,
+               max_retries = 5,
+               retry_delay = 1.):
+    self.s = session
+    self.url = url
+    self.filename = filename
+    self.progress = progress
+    self.chunk_size = chunk_size
+    self.max_retries = max_retries
+    self.retry_delay = retry_delay
+    self.size = os.path.getsize(filename)
+    self.retries = 0
+
+  def upload(self):
+    """Sends the file and returns the response to the completion request."""
+    r = self.s.post(self.url + '/uploads', json={'size': self.size,
+                                                 'sha256': file_digest(self.filename),
+                                                 'chunk_size': self.chunk_size})
+    r.raise_for_status()
+    upload = r.json()
+    upload_url = self.url + '/uploads/%s' % upload['id']
+    offset = upload['offset']
+
+    failures = 0
+    with open(self.filename, 'rb') as fd:
+      while offset < self.size:
+        self._report(offset)
+        fd.seek(offset)
+        chunk = fd.read(self.chunk_size)
+
+        try:
+          offset = self._put_chunk(upload_url, offset, chunk)
+          failures = 0
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, UploadError) as e:
+          failures += 1
+          self.retries += 1
+          if failures > self.max_retries:
+            raise UploadError("Upload failed after %d retries: %s" % (self.max_retries, e))
+          time.sleep(self.retry_delay * 2 ** (failures - 1))
+          offset = self._resume_offset(upload_url, offset)
+
+    self._report(offset)
+
+    return self.s.post(upload_url + '/complete')
+
+  def _report(self, offset):
+    self.progress.bytes_read = offset
+    self.progress.callback(self.progress)
+
+  def _put_chunk(self, upload_url, offset, chunk):
+    end = offset + len(chunk) - 1
+    r = self.s.put(upload_url,
+                   data=chunk,
+                   headers={'Content-Type': 'application/octet-stream',
+                            'Content-Range': 'bytes %d-%d/%d' % (offset, end, self.size),
+                            'X-Chunk-Sha256': hashlib.sha256(chunk).hexdigest()})
+
+    if r.status_code == 409:
+      return r.json()['offset']
+    if r.status_code == 400 or r.status_code >= 500:
+      raise UploadError("Chunk at offset %d was rejected with status %d" % (offset, r.status_code))
+    r.raise_for_status()
+
+    return r.json()['offset']
+
+  def _resume_offset(self, upload_url, offset):
+    try:
+      r = self.s.get(upload_url)
+      r.raise_for_status()
+      return r.json()['offset']
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError):
+      return offset
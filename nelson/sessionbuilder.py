@@ -1,10 +1,3 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-from future import standard_library
-from future.utils import bytes_to_native_str
-standard_library.install_aliases()
-from builtins import input
-from builtins import object
-
 import os
 import sys
 import json
@@ -12,10 +5,161 @@ import re
 import getpass
 import errno
 import copy
+import gzip
+import time
+import base64
+import hashlib
+import socket
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 from urllib.parse import urlsplit
+from . import telemetry
+from .telemetry import connection_stats
 
 HOTH_URL = "https://hoth.udacity.com"
+JSON_HEADERS = {'content-type':'application/json', 'accept': 'application/json'}
+
+#A saved token that passed /users/me this recently is trusted without asking again
+DEFAULT_VALIDATION_TTL = 3600
+#...unless its exp claim says it is about to run out
+EXPIRY_MARGIN = 60
+#Where the saved-token file keeps validation times and expiries
+METADATA_KEY = '_metadata'
+
+#JSON request bodies smaller than this are not worth compressing
+DEFAULT_COMPRESS_MIN_SIZE = 1 << 10
+
+#Pool sizes for the shared connection pools: hosts kept, and connections kept per host
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+
+def debug_enabled():
+  return bool(os.environ.get('NELSON_DEBUG'))
+
+def debug(message):
+  if debug_enabled():
+    print("[nelson] %s" % message, file=sys.stderr)
+
+def compress_request(request, min_size):
+  """Gzips a prepared request's JSON body in place if it is at least min_size bytes."""
+  body = request.body
+  if not isinstance(body, (bytes, str)) or len(body) < min_size:
+    return
+  if 'Content-Encoding' in request.headers:
+    return
+  if not request.headers.get('Content-Type', '').startswith('application/json'):
+    return
+
+  if isinstance(body, str):
+    body = body.encode('utf-8')
+  request.body = gzip.compress(body)
+  request.headers['Content-Encoding'] = 'gzip'
+  request.headers['Content-Length'] = str(len(request.body))
+
+class PooledAdapter(HTTPAdapter):
+  """An HTTPAdapter whose connections can use TCP keep-alive probes.
+
+  If compress_min_size is set, JSON request bodies of at least that
+  many bytes are sent gzipped.  Only use this with servers that accept
+  Content-Encoding: gzip on requests.  Responses are decoded according
+  to their Content-Encoding either way.
+  """
+  __attrs__ = HTTPAdapter.__attrs__ + ['keepalive', 'compress_min_size']
+
+  def __init__(self, keepalive = True, compress_min_size = None, **kwargs):
+    self.keepalive = keepalive
+    self.compress_min_size = compress_min_size
+    super(PooledAdapter, self).__init__(**kwargs)
+
+  def send(self, request, **kwargs):
+    if self.compress_min_size is not None:
+      compress_request(request, self.compress_min_size)
+    return super(PooledAdapter, self).send(request, **kwargs)
+
+  def init_poolmanager(self, *args, **kwargs):
+    if self.keepalive:
+      kwargs['socket_options'] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    super(PooledAdapter, self).init_poolmanager(*args, **kwargs)
+
+def enable_request_compression(session, min_size = DEFAULT_COMPRESS_MIN_SIZE):
+  """Makes session gzip its JSON request bodies of at least min_size bytes.
+
+  The session gets adapters of its own that share the connection pools
+  of its current ones, so other sessions on those pools are unaffected.
+  """
+  compressing = {}
+  for prefix, adapter in list(session.adapters.items()):
+    if id(adapter) not in compressing:
+      replacement = PooledAdapter(keepalive = getattr(adapter, 'keepalive', True), compress_min_size = min_size)
+      replacement.poolmanager = adapter.poolmanager
+      compressing[id(adapter)] = replacement
+    session.mount(prefix, compressing[id(adapter)])
+
+def debug_connection_stats(session):
+  if debug_enabled():
+    debug("{connections} connection(s) opened for {requests} request(s)".format(**connection_stats(session)))
+
+def jwt_expiry(jwt):
+  """The exp claim of a JWT (seconds since the epoch), or None.  The signature is not checked."""
+  try:
+    payload = jwt.split('.')[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode('utf-8'))
+    return float(claims['exp'])
+  except (IndexError, ValueError, TypeError, KeyError):
+    return None
+
+def token_fingerprint(jwt):
+  return hashlib.sha256(jwt.encode('utf-8')).hexdigest()[:16]
+
+def replayable(body):
+  return body is None or isinstance(body, (bytes, str))
+
+def debug_timing(step, seconds):
+  debug("auth step %s took %.3fs" % (step, seconds))
+
+#Results of /users/me checks made by this process, by (root url, token fingerprint)
+_validated_tokens = {}
+
+_pooled_adapters = {}
+_pooled_adapters_lock = threading.Lock()
+
+def pooled_adapter(root_url,
+                   pool_connections = DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize = DEFAULT_POOL_MAXSIZE,
+                   keepalive = True):
+  """Returns the process-wide adapter for root_url, creating it on first use.
+
+  Everything sent to a service goes through this adapter's connection
+  pool so that its connections stay warm.  The pool settings of the
+  first call win.
+  """
+  with _pooled_adapters_lock:
+    adapter = _pooled_adapters.get(root_url)
+    if adapter is None:
+      adapter = PooledAdapter(keepalive = keepalive,
+                              pool_connections = pool_connections,
+                              pool_maxsize = pool_maxsize)
+      _pooled_adapters[root_url] = adapter
+      debug("new connection pool for %s" % root_url)
+    return adapter
+
+def pooled_session(root_url,
+                   pool_connections = DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize = DEFAULT_POOL_MAXSIZE,
+                   keepalive = True):
+  """A new session for root_url on the service's shared connection pool.
+
+  Headers, cookies and hooks are the session's own, so sessions with
+  different credentials can share the pool safely.
+  """
+  adapter = pooled_adapter(root_url, pool_connections, pool_maxsize, keepalive)
+  session = requests.Session()
+  session.headers.update(JSON_HEADERS)
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
 
 def default_app_data_dir():
   APPNAME = "nelson"
@@ -32,83 +176,214 @@ class NelsonAuthenticationError(Exception):
     return repr(self.value)
 
 class SessionBuilder():
-  def __init__(self, root_url, id_provider, jwt_path):
+  def __init__(self, root_url, id_provider, jwt_path,
+               pool_connections = DEFAULT_POOL_CONNECTIONS,
+               pool_maxsize = DEFAULT_POOL_MAXSIZE,
+               keepalive = True,
+               validation_ttl = DEFAULT_VALIDATION_TTL,
+               timing_hook = None,
+               compress_requests = False):
     self.root_url = root_url
     self.id_provider = id_provider
     self.jwt_path = jwt_path
+    self.validation_ttl = validation_ttl
+    self.timing_hook = timing_hook or debug_timing
+    self.session = pooled_session(root_url, pool_connections, pool_maxsize, keepalive)
+    if compress_requests:
+      enable_request_compression(self.session)
+    self.jwt = None
+    self.reauthenticated = False
 
   def new(self):
-    session = requests.Session()
-    session.headers.update({'content-type':'application/json', 'accept': 'application/json'})
-
-    jwt = self.load_jwt_from_file()
+    """Returns this builder's session, authorized with a working token.
 
-    if jwt is None or not self.jwt_works(jwt):
-      jwt = self.login_for_jwt()
+    The steps are: load the saved token; unless it is known to work,
+    validate it; if there is none or it fails, log in, mint a token and
+    validate that.  A token is validated at most once per process, and
+    each step's latency is passed to timing_hook(step, seconds).
+    """
+    session = self.session
 
-      if jwt is None or not self.jwt_works(jwt):
-        raise RuntimeError("Authentication Failed.")
+    with telemetry.span('auth', session = session, id_provider = self.id_provider):
+      jwt = self.load_jwt_from_file()
 
-      save = input('Save the jwt?[y,N]')
-      if save.lower() == 'y':
-        self.save_the_jwt(jwt)
+      if jwt is None:
+        jwt = self.login()
 
+    self.jwt = jwt
     self.set_auth_headers(session, jwt)
 
+    if self.reauthenticate not in session.hooks['response']:
+      session.hooks['response'].append(self.reauthenticate)
+
     return session
 
+  def timed(self, step, fn, *args):
+    start = time.time()
+    try:
+      with telemetry.span('auth.' + step):
+        return fn(*args)
+    finally:
+      self.timing_hook(step, time.time() - start)
+
+  def login(self):
+    jwt = self.login_for_jwt()
+
+    if jwt is None or not self.jwt_works(jwt):
+      raise RuntimeError("Authentication Failed.")
+
+    save = input('Save the jwt?[y,N]')
+    if save.lower() == 'y':
+      self.save_the_jwt(jwt)
+
+    return jwt
+
   def set_auth_headers(self, session, jwt):
     session.headers.update({'authorization': 'Bearer ' + jwt})
 
   def jwt_works(self, jwt):
-    session = requests.Session()
-    session.headers.update({'content-type':'application/json', 'accept': 'application/json'})
-
-    self.set_auth_headers(session, jwt)
+    key = (self.root_url, token_fingerprint(jwt))
+    if key not in _validated_tokens:
+      _validated_tokens[key] = self.timed('validate', self.check_jwt, jwt)
+    return _validated_tokens[key]
 
-    r = session.get(url = self.root_url + '/users/me')
+  def check_jwt(self, jwt):
+    #The token goes on this request only; the session isn't authorized yet
+    r = self.session.get(url = self.root_url + '/users/me',
+                         headers = {'authorization': 'Bearer ' + jwt})
 
     return r.status_code == 200
 
-  def save_the_jwt(self, jwt):
+  def reauthenticate(self, r, *args, **kwargs):
+    """Response hook that recovers once from a token the service stopped accepting.
+
+    On the first 401 from the service, the token is checked again and, if
+    it really is no longer good, replaced through a fresh login.  The
+    request is then resent with the new token, unless its body was a
+    stream that has already been consumed; Submission builds those bodies
+    again itself.
+    """
+    if r.status_code != 401 or self.reauthenticated or self.jwt is None:
+      return r
+    if not r.url.startswith(self.root_url) or r.url == self.root_url + '/users/me':
+      return r
+
+    self.reauthenticated = True
+    self.forget_validation()
+
+    if not self.jwt_works(self.jwt):
+      self.jwt = self.login()
+      self.set_auth_headers(self.session, self.jwt)
+
+    if not replayable(r.request.body):
+      return r
+
+    request = r.request.copy()
+    request.headers['authorization'] = 'Bearer ' + self.jwt
+
+    #Read the 401 to the end so its connection goes back to the pool
+    r.content
+    r.close()
+    return self.session.send(request, **kwargs)
+
+  def read_jwt_file(self):
+    with open(self.jwt_path, "r") as fd:
+      return json.load(fd)
+
+  def write_jwt_file(self, jwt_obj):
     try:
-      os.makedirs(os.path.dirname(self.jwt_path))
+      os.makedirs(os.path.dirname(self.jwt_path) or '.')
     except OSError as exception:
       if exception.errno != errno.EEXIST:
         raise
 
+    with open(self.jwt_path, "w") as fd:
+      json.dump(jwt_obj, fd)
+
+  def save_the_jwt(self, jwt):
     try:
-      with open(self.jwt_path, "r") as fd:
-        jwt_obj = json.load(fd)
+      jwt_obj = self.read_jwt_file()
     except:
       jwt_obj = {}
 
     jwt_obj[self.id_provider] = jwt
-    with open(self.jwt_path, "w") as fd:
-      json.dump(jwt_obj, fd)
+    self.write_jwt_file(jwt_obj)
+    self.record_validation(jwt)
+
+  def record_validation(self, jwt, validated_at = None):
+    """Notes in the saved-token file that jwt was just accepted by the service."""
+    try:
+      jwt_obj = self.read_jwt_file()
+    except (IOError, ValueError):
+      return
+
+    if jwt_obj.get(self.id_provider) != jwt:
+      return
+
+    jwt_obj.setdefault(METADATA_KEY, {})[self.id_provider] = {
+      'token': token_fingerprint(jwt),
+      'validated_at': time.time() if validated_at is None else validated_at,
+      'expires_at': jwt_expiry(jwt)}
+    self.write_jwt_file(jwt_obj)
+
+  def forget_validation(self):
+    if self.jwt is not None:
+      _validated_tokens.pop((self.root_url, token_fingerprint(self.jwt)), None)
 
+    try:
+      jwt_obj = self.read_jwt_file()
+    except (IOError, ValueError):
+      return
+
+    if jwt_obj.get(METADATA_KEY, {}).pop(self.id_provider, None) is not None:
+      self.write_jwt_file(jwt_obj)
+
+  def recently_validated(self, jwt, jwt_obj):
+    meta = jwt_obj.get(METADATA_KEY, {}).get(self.id_provider)
+    if not meta or meta.get('token') != token_fingerprint(jwt):
+      return False
+
+    now = time.time()
+    expires_at = meta.get('expires_at')
+    if expires_at is not None and expires_at < now + EXPIRY_MARGIN:
+      return False
+
+    return now - meta.get('validated_at', 0) < self.validation_ttl
 
   def load_jwt_from_file(self):
     try:
-      with open(self.jwt_path, "r") as fd:
-        jwt_obj = json.load(fd)
+      jwt_obj = self.timed('load', self.read_jwt_file)
 
       jwt = jwt_obj[self.id_provider]
-      
-      if jwt is None or not self.jwt_works(jwt):
+
+      if jwt is not None and self.recently_validated(jwt, jwt_obj):
+        debug("using the saved token without checking it")
+      elif jwt is None or not self.jwt_works(jwt):
         jwt = None
+      else:
+        self.record_validation(jwt)
 
     except (requests.exceptions.HTTPError, IOError, ValueError, KeyError) as e:
       jwt = None
 
     return jwt
 
+  def login_session(self):
+    """A session with its own cookies for logging in, on the shared connection pool."""
+    session = requests.Session()
+    session.headers.update(JSON_HEADERS)
+    for prefix, adapter in self.session.adapters.items():
+      session.mount(prefix, adapter)
+    return session
+
   def login_for_jwt(self):
-    try:
-      session = requests.Session()
-      session.headers.update({'content-type':'application/json', 'accept': 'application/json'})
+    session = self.login_session()
+    self.timed('login', self.log_in, session)
+    return self.timed('mint', self.mint_jwt, session)
 
-      password_prompt = bytes_to_native_str(b"Password :")
+  def log_in(self, session):
+    try:
+      password_prompt = str("Password :")
 
       if self.id_provider == 'udacity':
         print("Udacity Login required.")
@@ -130,6 +405,7 @@ class SessionBuilder():
       else:
         raise e
 
+  def mint_jwt(self, session):
     r = session.post(self.root_url + '/auth_tokens')
     r.raise_for_status()
 
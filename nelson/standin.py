@@ -0,0 +1,502 @@
+import io
+import re
+import gzip
+import hashlib
+import json
+import zipfile
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from .abstract import Submission as AbstractSubmission
+from .archive import expand_duplicates
+from .events import format_event, EVENT_STREAM_TYPE
+
+#A local stand-in for the bonnie/project-assistant submission services.
+#It speaks just enough of their protocol to exercise the client in tests
+#and benchmarks without network access or credentials.
+
+SUBMISSION_PATH = re.compile(r'^/student/([^/]+)/([^/]+)/([^/]+)/([^/]+)/submission(?:/(.*))?$')
+
+def list_files(z):
+  return {'files': sorted(z.namelist())}
+
+class BadRequest(ValueError):
+  """The request body could not be read; answered with a 400."""
+  pass
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class StandinHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  #Headers and body go out in separate writes; don't let Nagle hold the body back
+  disable_nagle_algorithm = True
+
+  def log_message(self, format, *args):
+    pass
+
+  @property
+  def standin(self):
+    return self.server.standin
+
+  def read_body(self):
+    if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+      chunks = []
+      while True:
+        line = self.rfile.readline()
+        try:
+          size = int(line.split(b';')[0].strip(), 16)
+        except ValueError:
+          raise BadRequest("Bad chunk size %r" % line)
+        if size == 0:
+          self.rfile.readline()
+          break
+        chunks.append(self._read_exactly(size))
+        self.rfile.readline()
+      body = b''.join(chunks)
+    else:
+      body = self._read_exactly(int(self.headers.get('Content-Length') or 0))
+
+    self.standin.bytes_received += len(body)
+    if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+      body = gzip.decompress(body)
+    return body
+
+  def _read_exactly(self, size):
+    data = self.rfile.read(size)
+    if len(data) < size:
+      raise BadRequest("Body ended after %d of %d bytes" % (len(data), size))
+    return data
+
+  def read_json(self):
+    return json.loads(self.read_body().decode('utf-8'))
+
+  def send_json(self, obj, status = 200, headers = {}):
+    body = json.dumps(obj).encode('utf-8')
+
+    min_size = self.standin.gzip_min_size
+    if min_size is not None and len(body) >= min_size and 'gzip' in self.headers.get('Accept-Encoding', ''):
+      body = gzip.compress(body)
+      headers = dict(headers, **{'Content-Encoding': 'gzip'})
+
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    for name, value in sorted(headers.items()):
+      self.send_header(name, value)
+    self.end_headers()
+    #Counted first so that it is up to date by the time the client has the response
+    self.standin.bytes_sent += len(body)
+    self.wfile.write(body)
+
+  def send_cacheable(self, obj):
+    """Sends obj with an ETag, or just a 304 if the client already has it."""
+    body = json.dumps(obj).encode('utf-8')
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+    if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+      self.standin.not_modified += 1
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.end_headers()
+      return
+
+    self.send_json(obj, headers = {'ETag': etag})
+
+  def dispatch(self, method):
+    self.standin.requests.append((method, self.path))
+    try:
+      self.route(method)
+    except BadRequest as e:
+      #What is left of the connection can't be parsed as a request
+      self.close_connection = True
+      try:
+        self.send_json({'message': str(e)}, 400)
+      except (BrokenPipeError, ConnectionResetError):
+        #Usually the client gave up on the body and is already gone
+        pass
+
+  def route(self, method):
+    if self.path == '/auth/developer/callback':
+      self.read_body()
+      return self.send_json({})
+
+    if self.path == '/auth_tokens':
+      self.read_body()
+      return self.send_json({'auth_token': self.standin.mint_token()})
+
+    tokens = self.standin.accepted_tokens
+    if tokens is not None and self.headers.get('Authorization') not in ['Bearer ' + t for t in tokens]:
+      #Discard any body so the connection can be reused
+      self.read_body()
+      return self.send_json({'message': 'Unauthorized'}, 401)
+
+    if self.path == '/users/me':
+      return self.send_json({})
+
+    match = SUBMISSION_PATH.match(self.path)
+    if match is None:
+      return self.send_json({'message': 'Not found'}, 404)
+
+    rest = match.group(5) or ''
+    route = getattr(self, 'route_%s' % method.lower())
+    return route(rest)
+
+  def do_GET(self):
+    self.dispatch('GET')
+
+  def do_POST(self):
+    self.dispatch('POST')
+
+  def do_PUT(self):
+    self.dispatch('PUT')
+
+  def send_throttled(self, retry_after):
+    self.send_json({'message': 'Slow down'}, 429, headers = {'Retry-After': str(retry_after)})
+
+  def send_events(self, rest):
+    if not self.standin.push_events:
+      return self.send_json({'message': 'Not found'}, 404)
+
+    submission = self.standin.status(rest)
+    if submission is None:
+      return self.send_json({'message': 'Not found'}, 404)
+
+    self.send_response(200)
+    self.send_header('Content-Type', EVENT_STREAM_TYPE)
+    self.send_header('Cache-Control', 'no-cache')
+    self.send_header('Transfer-Encoding', 'chunked')
+    self.end_headers()
+    self.close_connection = True
+
+    try:
+      self.write_chunk(format_event('status', json.dumps(submission)))
+      graded = submission['feedback'] is not None or submission['error_report'] is not None
+      while not graded:
+        submission = self.standin.wait_for_grade(rest, self.standin.heartbeat)
+        graded = submission is not None
+        if graded:
+          self.write_chunk(format_event('status', json.dumps(submission)))
+        else:
+          self.write_chunk(b': keepalive\n\n')
+      self.write_chunk(b'')
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+
+  def write_chunk(self, data):
+    self.standin.bytes_sent += len(data)
+    self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+    self.wfile.flush()
+
+  def route_get(self, rest):
+    if rest.endswith('/events'):
+      return self.send_events(rest[:-len('/events')])
+
+    if rest.startswith('uploads/'):
+      upload = self.standin.uploads.get(rest[len('uploads/'):])
+      if upload is None:
+        return self.send_json({'message': 'Not found'}, 404)
+      return self.send_json({'offset': len(upload['data'])})
+
+    if self.standin.take_throttle():
+      return self.send_throttled(self.standin.retry_after)
+
+    submission = self.standin.poll(rest)
+    if submission is None:
+      return self.send_json({'message': 'Not found'}, 404)
+    return self.send_cacheable(submission)
+
+  def route_post(self, rest):
+    if rest == '':
+      if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+        zipbytes = parse_multipart_file(self.headers['Content-Type'], self.read_body())
+      else:
+        manifest = self.read_json()['manifest']
+        try:
+          zipbytes = self.standin.rebuild_zip(manifest)
+        except KeyError as e:
+          return self.send_json({'message': 'Missing blob %s' % e.args[0]}, 400)
+
+      return self.send_json(self.standin.create_submission(zipbytes))
+
+    if rest == 'manifest':
+      files = self.read_json()['files']
+      return self.send_json({'missing': self.standin.missing_blobs(f['sha256'] for f in files)})
+
+    if rest == 'uploads':
+      return self.send_json(self.standin.create_upload(self.read_json()))
+
+    if rest.startswith('uploads/') and rest.endswith('/complete'):
+      upload = self.standin.uploads.get(rest[len('uploads/'):-len('/complete')])
+      if upload is None:
+        return self.send_json({'message': 'Not found'}, 404)
+      data = bytes(upload['data'])
+      if len(data) != upload['size'] or hashlib.sha256(data).hexdigest() != upload['sha256']:
+        return self.send_json({'message': 'Upload is incomplete or corrupt'}, 400)
+      return self.send_json(self.standin.create_submission(data))
+
+    return self.send_json({'message': 'Not found'}, 404)
+
+  def route_put(self, rest):
+    if rest.startswith('blobs/'):
+      digest = rest[len('blobs/'):]
+      data = self.read_body()
+      if hashlib.sha256(data).hexdigest() != digest:
+        return self.send_json({'message': 'Blob does not match its digest'}, 400)
+      self.standin.store_blob(digest, data)
+      return self.send_json({})
+
+    if rest.startswith('uploads/'):
+      return self.put_chunk(rest[len('uploads/'):])
+
+    return self.send_json({'message': 'Not found'}, 404)
+
+  def put_chunk(self, upload_id):
+    upload = self.standin.uploads.get(upload_id)
+    data = self.read_body()
+    if upload is None:
+      return self.send_json({'message': 'Not found'}, 404)
+
+    if self.standin.take_interruption():
+      #Drop the connection without answering, as a flaky network would
+      self.close_connection = True
+      return
+
+    start = int(re.match(r'bytes (\d+)-', self.headers['Content-Range']).group(1))
+    if start != len(upload['data']):
+      return self.send_json({'offset': len(upload['data'])}, 409)
+    if hashlib.sha256(data).hexdigest() != self.headers['X-Chunk-Sha256']:
+      return self.send_json({'message': 'Chunk checksum mismatch'}, 400)
+
+    upload['data'].extend(data)
+    return self.send_json({'offset': len(upload['data'])})
+
+def parse_multipart_file(content_type, body):
+  boundary = re.search('boundary=([^;]+)', content_type).group(1).strip('"').encode('utf-8')
+  for part in body.split(b'--' + boundary):
+    if b'\r\n\r\n' in part and b'filename=' in part.split(b'\r\n\r\n', 1)[0]:
+      return part.split(b'\r\n\r\n', 1)[1][:-2]
+  raise ValueError("No file in multipart body")
+
+class BonnieStandin(object):
+  """Runs the stand-in server on a background thread.
+
+  grader is called with each submitted zipfile.ZipFile and returns the
+  feedback document.  The submission stays pending for the first
+  pending_polls polls, and pending submissions carry eta_seconds if it is
+  set.  If grading_time is set, submissions are instead graded that many
+  seconds after they arrive, however often they are polled.  The next
+  throttled_polls polls are answered with a 429 and a Retry-After of
+  retry_after seconds.  The next interrupted_chunks chunk uploads are
+  read and then dropped without a response.
+
+  Unless push_events is False, GET <submission>/events streams the
+  submission as server-sent events until it is graded, with a keepalive
+  every heartbeat seconds.
+
+  If accepted_tokens is a list, requests without one of them as a bearer
+  token get a 401; developer logins mint new tokens and add them to it.
+
+  Gzipped request bodies are always accepted.  JSON responses of at least
+  gzip_min_size bytes are gzipped for clients that accept it.
+  """
+  def __init__(self, grader = list_files, pending_polls = 0, eta_seconds = None,
+               throttled_polls = 0, retry_after = 1, interrupted_chunks = 0,
+               grading_time = None, push_events = True, heartbeat = 15.,
+               accepted_tokens = None, gzip_min_size = None,
+               host = '127.0.0.1', port = 0):
+    self.grader = grader
+    self.pending_polls = pending_polls
+    self.eta_seconds = eta_seconds
+    self.throttled_polls = throttled_polls
+    self.retry_after = retry_after
+    self.interrupted_chunks = interrupted_chunks
+    self.grading_time = grading_time
+    self.push_events = push_events
+    self.heartbeat = heartbeat
+    self.accepted_tokens = accepted_tokens
+    self.gzip_min_size = gzip_min_size
+    self.minted_tokens = 0
+    self.not_modified = 0
+    self.lock = threading.Lock()
+    self.graded = threading.Condition(self.lock)
+
+    self.submissions = {}
+    self.zips = {}
+    self.blobs = {}
+    self.uploads = {}
+    self.requests = []
+    self.bytes_received = 0
+    self.bytes_sent = 0
+
+    self.httpd = _ThreadingHTTPServer((host, port), StandinHandler)
+    self.httpd.standin = self
+    self.thread = None
+
+  @property
+  def url(self):
+    host, port = self.httpd.server_address[:2]
+    return 'http://%s:%d' % (host, port)
+
+  def start(self):
+    self.thread = threading.Thread(target=self.httpd.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+    self.thread.join()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc_info):
+    self.stop()
+
+  def create_submission(self, zipbytes):
+    try:
+      expanded = io.BytesIO()
+      expand_duplicates(io.BytesIO(zipbytes), expanded)
+      zipbytes = expanded.getvalue()
+    except zipfile.BadZipfile:
+      #Left for the grader to report
+      pass
+
+    with self.lock:
+      sid = len(self.submissions) + 1
+      self.zips[sid] = zipbytes
+      self.submissions[sid] = {'id': sid,
+                               'polls': 0,
+                               'feedback': None,
+                               'console': None,
+                               'error_report': None}
+
+      if self.grading_time is not None:
+        timer = threading.Timer(self.grading_time, self.grade_later, [sid])
+        timer.daemon = True
+        timer.start()
+
+      return self.public(sid)
+
+  def public(self, sid):
+    submission = dict((k, v) for k, v in self.submissions[sid].items() if k != 'polls')
+    if self.eta_seconds is not None and submission['feedback'] is None:
+      submission['eta_seconds'] = self.eta_seconds
+    return submission
+
+  def find(self, rest):
+    try:
+      sid = int(rest)
+    except ValueError:
+      return None
+    return sid if sid in self.submissions else None
+
+  def poll(self, rest):
+    with self.lock:
+      sid = self.find(rest)
+      if sid is None:
+        return None
+
+      submission = self.submissions[sid]
+      submission['polls'] += 1
+      if self.grading_time is None and not self.is_graded(sid) and submission['polls'] > self.pending_polls:
+        self.grade(sid)
+
+      return self.public(sid)
+
+  def status(self, rest):
+    with self.lock:
+      sid = self.find(rest)
+      return None if sid is None else self.public(sid)
+
+  def wait_for_grade(self, rest, timeout):
+    """Returns the graded submission, or None if it is still pending after timeout seconds."""
+    with self.lock:
+      sid = self.find(rest)
+      if self.graded.wait_for(lambda: self.is_graded(sid), timeout):
+        return self.public(sid)
+      return None
+
+  def is_graded(self, sid):
+    submission = self.submissions[sid]
+    return submission['feedback'] is not None or submission['error_report'] is not None
+
+  def grade_later(self, sid):
+    with self.lock:
+      if not self.is_graded(sid):
+        self.grade(sid)
+
+  def grade(self, sid):
+    submission = self.submissions[sid]
+    try:
+      with zipfile.ZipFile(io.BytesIO(self.zips[sid])) as z:
+        submission['feedback'] = self.grader(z)
+    except Exception as e:
+      submission['error_report'] = {'message': str(e)}
+    self.graded.notify_all()
+
+  def create_upload(self, params):
+    with self.lock:
+      upload_id = str(len(self.uploads) + 1)
+      self.uploads[upload_id] = {'size': params['size'],
+                                 'sha256': params['sha256'],
+                                 'data': bytearray()}
+      return {'id': upload_id, 'offset': 0}
+
+  def mint_token(self):
+    with self.lock:
+      self.minted_tokens += 1
+      token = 'standin-token-%d' % self.minted_tokens
+      if self.accepted_tokens is not None:
+        self.accepted_tokens.append(token)
+      return token
+
+  def take_throttle(self):
+    with self.lock:
+      if self.throttled_polls > 0:
+        self.throttled_polls -= 1
+        return True
+      return False
+
+  def take_interruption(self):
+    with self.lock:
+      if self.interrupted_chunks > 0:
+        self.interrupted_chunks -= 1
+        return True
+      return False
+
+  def missing_blobs(self, digests):
+    with self.lock:
+      return sorted(set(d for d in digests if d not in self.blobs))
+
+  def store_blob(self, digest, data):
+    with self.lock:
+      self.blobs[digest] = data
+
+  def rebuild_zip(self, manifest):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as z:
+      for f in manifest:
+        z.writestr(f['path'], self.blobs[f['sha256']])
+    return out.getvalue()
+
+#Submissions addressed to a stand-in, laid out like GTOMSCS quiz submissions
+class Submission(AbstractSubmission):
+  def __init__(self, root_url, session, filenames, quiz_name = 'standin', **kwargs):
+    self.root_url = root_url
+    self.quiz_name = quiz_name
+
+    super(Submission, self).__init__(session, filenames, **kwargs)
+
+  def project_name(self):
+    return self.quiz_name
+
+  def _get_submit_url(self):
+    return self.root_url + "/student/course/standin/quiz/%s/submission" % self.quiz_name
+
+  def _get_poll_url(self):
+    return self.root_url + "/student/course/standin/quiz/%s/submission/%s" % (self.quiz_name, self.submission['id'])
@@ -0,0 +1,161 @@
+#Spans and events describing where a submission spends its time.
+#
+#nelson itself records these spans:
+#
+#  auth (auth.load, auth.validate, auth.login, auth.mint)
+#  upload (zip)
+#  wait
+#
+#Each span carries its wall time and, where they apply, bytes and the
+#requests and connections it used.  Submit scripts can add their own:
+#
+#  from nelson import telemetry
+#
+#  telemetry.configure(telemetry.StderrSummary(), telemetry.JsonlSink('timings.jsonl'))
+#  with telemetry.span('compile', target = 'helloworld'):
+#    ...
+#
+#A sink is any callable taking a record dict, so a plain function works
+#as a callback sink.  Nothing is recorded until a sink is configured.
+
+import sys
+import json
+import time
+import threading
+import contextlib
+
+def connection_stats(session):
+  """Counts the connections opened (i.e. TCP/TLS handshakes) and requests sent through session."""
+  stats = {'connections': 0, 'requests': 0}
+  for adapter in set(session.adapters.values()):
+    pools = getattr(adapter, 'poolmanager', None)
+    if pools is None:
+      continue
+    for key in pools.pools.keys():
+      pool = pools.pools.get(key)
+      if pool is not None:
+        stats['connections'] += pool.num_connections
+        stats['requests'] += pool.num_requests
+  return stats
+
+class Span(object):
+  def __init__(self, name, parent, attrs, session = None):
+    self.name = name
+    self.parent = parent
+    self.attrs = attrs
+    self.session = session
+    self.baseline = connection_stats(session) if session is not None else None
+    self.start = time.time()
+    self.duration = None
+
+  def set(self, **attrs):
+    self.attrs.update(attrs)
+
+  def add(self, key, amount):
+    self.attrs[key] = self.attrs.get(key, 0) + amount
+
+  def finish(self):
+    self.duration = time.time() - self.start
+    if self.session is not None:
+      stats = connection_stats(self.session)
+      for key in stats:
+        self.add(key, stats[key] - self.baseline[key])
+
+  def record(self):
+    return {'type': 'span',
+            'name': self.name,
+            'parent': self.parent,
+            'start': self.start,
+            'duration': self.duration,
+            'attrs': self.attrs}
+
+class Recorder(object):
+  """Hands finished spans and events to its sinks.
+
+  Spans nest per thread: a span opened inside another names it as its
+  parent.
+  """
+  def __init__(self, sinks = ()):
+    self.sinks = list(sinks)
+    self.local = threading.local()
+
+  def stack(self):
+    if not hasattr(self.local, 'stack'):
+      self.local.stack = []
+    return self.local.stack
+
+  @contextlib.contextmanager
+  def span(self, name, session = None, **attrs):
+    """Times the enclosed block, counting session's requests if given."""
+    if not self.sinks:
+      yield Span(name, None, attrs)
+      return
+
+    stack = self.stack()
+    span = Span(name, stack[-1].name if stack else None, attrs, session)
+    stack.append(span)
+    try:
+      yield span
+    except Exception as e:
+      span.set(error = str(e))
+      raise
+    finally:
+      stack.pop()
+      span.finish()
+      self.emit(span.record())
+
+  def event(self, name, **attrs):
+    if not self.sinks:
+      return
+    stack = self.stack()
+    self.emit({'type': 'event',
+               'name': name,
+               'parent': stack[-1].name if stack else None,
+               'start': time.time(),
+               'attrs': attrs})
+
+  def emit(self, record):
+    for sink in self.sinks:
+      sink(record)
+
+class StderrSummary(object):
+  """Prints one line per top-level span (or every span, if nested is set)."""
+  def __init__(self, nested = False, stream = None):
+    self.nested = nested
+    self.stream = stream
+
+  def __call__(self, record):
+    if record['type'] != 'span' or (record['parent'] is not None and not self.nested):
+      return
+
+    parts = ["%.3fs" % record['duration']]
+    for key, value in sorted(record['attrs'].items()):
+      parts.append("%s=%s" % (key, value))
+    print("[nelson] %-16s %s" % (record['name'], ' '.join(parts)), file = self.stream or sys.stderr)
+
+class JsonlSink(object):
+  """Appends every record to a file as one json line."""
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+
+  def __call__(self, record):
+    line = json.dumps(record, separators = (',', ':'), default = str)
+    with self.lock:
+      with open(self.path, 'a') as fd:
+        fd.write(line + '\n')
+
+_recorder = Recorder()
+
+def recorder():
+  return _recorder
+
+def configure(*sinks):
+  """Replaces the sinks of nelson's recorder; with no arguments, turns recording off."""
+  _recorder.sinks = list(sinks)
+
+def span(name, session = None, **attrs):
+  return _recorder.span(name, session = session, **attrs)
+
+def event(name, **attrs):
+  _recorder.event(name, **attrs)
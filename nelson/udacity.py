@@ -1,14 +1,10 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-from future import standard_library
-standard_library.install_aliases()
-from builtins import input
-from builtins import object
 import sys
 import os
 from .abstract import Submission as AbstractSubmission
 from .abstract import submit as abstractsubmit
-from .uploadcallbacks import progressbar_callback
-from .sessionbuilder import SessionBuilder, default_app_data_dir
+from .aio import AsyncSubmission as AbstractAsyncSubmission
+from .uploadcallbacks import ProgressRenderer
+from .sessionbuilder import SessionBuilder, default_app_data_dir, DEFAULT_VALIDATION_TTL
 
 def root_url(environment):
   url = {'development': 'http://local-dev.udacity.com:3000',
@@ -17,12 +13,15 @@ def root_url(environment):
 
   return url[environment]
 
-def build_session(environment = 'production', id_provider = 'udacity', jwt_path = None):
+def build_session(environment = 'production', id_provider = 'udacity', jwt_path = None, compress_requests = False,
+                  validation_ttl = DEFAULT_VALIDATION_TTL):
     jwt_path = jwt_path or os.path.join(default_app_data_dir(), 'udacity_jwt')
 
     return SessionBuilder(root_url(environment),
                           id_provider,
-                          jwt_path).new()
+                          jwt_path,
+                          validation_ttl = validation_ttl,
+                          compress_requests = compress_requests).new()
 
 def submit(nanodegree, 
            project, 
@@ -32,9 +31,22 @@ def submit(nanodegree,
            max_zip_size = 8 << 20,
            zipfile_root = os.path.dirname(sys.argv[0]),
            jwt_path = None,
-           refresh_time = 3):
+           refresh_time = 3,
+           stream_upload = False,
+           incremental = False,
+           zip_workers = 1,
+           compression_policy = None,
+           chunked_upload = False,
+           archive_cache = None,
+           excludes = None,
+           dedupe = False,
+           push_results = False,
+           compress_requests = False,
+           validation_ttl = DEFAULT_VALIDATION_TTL,
+           result_writer = None,
+           precheck = None):
 
-    session = build_session(environment, id_provider, jwt_path)
+    session = build_session(environment, id_provider, jwt_path, compress_requests, validation_ttl)
     
     submission = Submission(nanodegree,
                             project,
@@ -42,10 +54,22 @@ def submit(nanodegree,
                             filenames,
                             max_zip_size = max_zip_size,
                             zipfile_root = zipfile_root,
-                            upload_progress_callback = progressbar_callback,
-                            environment = environment)
+                            upload_progress_callback = ProgressRenderer(),
+                            environment = environment,
+                            stream_upload = stream_upload,
+                            incremental = incremental,
+                            zip_workers = zip_workers,
+                            compression_policy = compression_policy,
+                            chunked_upload = chunked_upload,
+                            archive_cache = archive_cache,
+                            excludes = excludes,
+                            dedupe = dedupe)
 
-    return abstractsubmit(submission, refresh_time = refresh_time)
+    return abstractsubmit(submission,
+                          refresh_time = refresh_time,
+                          push_results = push_results,
+                          result_writer = result_writer,
+                          precheck = precheck)
 
 
 #Submissions for GTOMSCS
@@ -58,7 +82,15 @@ class Submission(AbstractSubmission):
                max_zip_size = 8 << 20,
                zipfile_root = os.path.dirname(sys.argv[0]),
                upload_progress_callback = None,
-               environment = 'production'):
+               environment = 'production',
+               stream_upload = False,
+               incremental = False,
+               zip_workers = 1,
+               compression_policy = None,
+               chunked_upload = False,
+               archive_cache = None,
+               excludes = None,
+               dedupe = False):
 
     self.nanodegree = nanodegree
     self.project = project
@@ -68,7 +100,15 @@ class Submission(AbstractSubmission):
                                      filenames,
                                      max_zip_size = max_zip_size,
                                      zipfile_root = zipfile_root,
-                                     upload_progress_callback = upload_progress_callback)
+                                     upload_progress_callback = upload_progress_callback,
+                                     stream_upload = stream_upload,
+                                     incremental = incremental,
+                                     zip_workers = zip_workers,
+                                     compression_policy = compression_policy,
+                                     chunked_upload = chunked_upload,
+                                     archive_cache = archive_cache,
+                                     excludes = excludes,
+                                     dedupe = dedupe)
 
   def project_name(self):
     return self.project
@@ -79,3 +119,8 @@ class Submission(AbstractSubmission):
   def _get_poll_url(self):
     return root_url(self.environment) + "/student/nanodegree/%s/project/%s/submission/%s" % (self.nanodegree, self.project, self.submission['id'])
 
+#asyncio counterpart, taking the same arguments plus an optional executor
+class AsyncSubmission(AbstractAsyncSubmission):
+  def __init__(self, *args, **kwargs):
+    executor = kwargs.pop('executor', None)
+    super(AsyncSubmission, self).__init__(Submission(*args, **kwargs), executor = executor)
@@ -1,21 +1,115 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-from future import standard_library
-standard_library.install_aliases()
-from builtins import input
-from builtins import object
 import sys
+import time
+
+DEFAULT_MAX_REDRAWS = 10
+DEFAULT_LINE_INTERVAL = 10.
 
 def default_upload_progress_callback(encoder):
   pass
 
-def progressbar_callback(monitor):
-  total_bytes = monitor.encoder.len
-  pct = float(monitor.bytes_read) / total_bytes
+def format_bytes(n):
+  for unit in ['B', 'KB', 'MB', 'GB']:
+    if n < 1024 or unit == 'GB':
+      return "{:.0f} {}".format(n, unit) if unit == 'B' else "{:.1f} {}".format(n, unit)
+    n /= 1024.
+
+def format_duration(seconds):
+  minutes, seconds = divmod(int(seconds + 0.5), 60)
+  hours, minutes = divmod(minutes, 60)
+  return "{}:{:02d}:{:02d}".format(hours, minutes, seconds) if hours else "{}:{:02d}".format(minutes, seconds)
 
+def progress_bar(pct):
   l_fill = "{:<27}".format("=" * min(int(min(0.5, pct) / 0.5 * 30), 27))
   p_fill = "{:^4}".format(str(int(pct * 100)) + "%")
   r_fill = "{:<27}".format("=" * min(int(min(pct - 0.5, 0.5) / 0.5 * 30), 27))
-  ratio = "{!s}/{!s}".format(monitor.bytes_read, total_bytes)
-  line = "[{} {} {}] {}".format(l_fill, p_fill, r_fill, ratio)
-  sys.stdout.write("\r{}".format(line))
-  sys.stdout.flush()
+  return "[{} {} {}]".format(l_fill, p_fill, r_fill)
+
+class ProgressRenderer(object):
+  """Upload callback showing progress, throughput and ETA.
+
+  On a terminal the line is redrawn in place at most max_redraws times a
+  second.  Otherwise (CI logs, pipes) a plain line is printed at every
+  10%, or every line_interval seconds while the size is unknown.  The
+  finished state is always shown.  A new monitor object starts a new
+  upload, so an instance can be reused across submissions.
+  """
+  def __init__(self, stream = None, max_redraws = DEFAULT_MAX_REDRAWS,
+               line_interval = DEFAULT_LINE_INTERVAL, interactive = None, clock = time.time):
+    self.stream = stream
+    self.min_interval = 1. / max_redraws
+    self.line_interval = line_interval
+    self.interactive = interactive
+    self.clock = clock
+    self.monitor = None
+
+  def _out(self):
+    return self.stream or sys.stdout
+
+  def _is_interactive(self):
+    if self.interactive is not None:
+      return self.interactive
+    isatty = getattr(self._out(), 'isatty', None)
+    return bool(isatty and isatty())
+
+  def _start(self, monitor, now):
+    self.monitor = monitor
+    self.start = now
+    self.start_bytes = monitor.bytes_read
+    self.last_draw = None
+    self.last_step = -1
+    self.width = 0
+    self.finished = False
+
+  def __call__(self, monitor):
+    now = self.clock()
+    if monitor is not self.monitor:
+      self._start(monitor, now)
+
+    total = monitor.encoder.len
+    done = total is not None and monitor.bytes_read >= total
+    interactive = self._is_interactive()
+
+    if done and self.finished:
+      return
+    if not done:
+      if interactive or total is None:
+        interval = self.min_interval if interactive else self.line_interval
+        if self.last_draw is not None and now - self.last_draw < interval:
+          return
+      elif int(10 * monitor.bytes_read / total) <= self.last_step:
+        return
+
+    self.last_draw = now
+    self.finished = done
+    if total:
+      self.last_step = int(10 * monitor.bytes_read / total)
+
+    line = self.render(monitor.bytes_read, total, now - self.start)
+    out = self._out()
+    if interactive:
+      #Pad over whatever is left of a longer previous line
+      out.write("\r" + line.ljust(self.width))
+      self.width = len(line)
+    else:
+      out.write(line + "\n")
+    out.flush()
+
+  def render(self, bytes_read, total, elapsed):
+    rate = (bytes_read - self.start_bytes) / elapsed if elapsed > 0 else None
+    speed = "{}/s".format(format_bytes(rate)) if rate else "--"
+
+    #Streamed uploads don't know their size until the end
+    if total is None:
+      return "{} sent  {}".format(format_bytes(bytes_read), speed)
+
+    pct = float(bytes_read) / total if total else 1.
+    if bytes_read >= total:
+      eta = "in " + format_duration(elapsed)
+    elif rate:
+      eta = "ETA " + format_duration((total - bytes_read) / rate)
+    else:
+      eta = "ETA --:--"
+    return "{} {}/{}  {}  {}".format(progress_bar(pct), format_bytes(bytes_read), format_bytes(total), speed, eta)
+
+#Kept for scripts that pass it as upload_progress_callback
+progressbar_callback = ProgressRenderer()
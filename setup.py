@@ -19,7 +19,7 @@ setup(
     long_description=open('README.rst').read(),
     install_requires=[
         "requests >= 2.2.1",
-        "requests-toolbelt >= 0.7.0",
-        "future"
+        "requests-toolbelt >= 0.7.0"
     ],
+    python_requires='>=3.7',
 )
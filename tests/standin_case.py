@@ -0,0 +1,35 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from nelson.standin import BonnieStandin
+
+class TempDirTestCase(unittest.TestCase):
+  """Runs every test from a fresh temporary directory, removed afterwards."""
+
+  def setUp(self):
+    self.tmp_path = tempfile.mkdtemp()
+    self.cwd = os.getcwd()
+    os.chdir(self.tmp_path)
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.tmp_path)
+
+class StandinTestCase(TempDirTestCase):
+  """Also starts a BonnieStandin for every test, as self.standin.
+
+  Subclasses pass it options by overriding standin_options.
+  """
+
+  def standin_options(self):
+    return {}
+
+  def setUp(self):
+    super(StandinTestCase, self).setUp()
+    self.standin = BonnieStandin(**self.standin_options()).start()
+
+  def tearDown(self):
+    self.standin.stop()
+    super(StandinTestCase, self).tearDown()
@@ -0,0 +1,59 @@
+import unittest
+import os
+import asyncio
+import requests
+
+from nelson.aio import AsyncSubmission
+from nelson.standin import Submission
+from standin_case import StandinTestCase
+
+class TestAsyncSubmission(StandinTestCase):
+
+  def standin_options(self):
+    return {'pending_polls': 2}
+
+  def submission(self, filenames, **kwargs):
+    return AsyncSubmission(Submission(self.standin.url, requests.Session(), filenames, zipfile_root = '', **kwargs))
+
+  def test_concurrent_submissions(self):
+    """Many submissions share one loop without clobbering each other's archives"""
+    filenames = []
+    for i in range(20):
+      filenames.append(['common.py', 'student%d.py' % i])
+      with open(filenames[-1][1], 'w') as fd:
+        fd.write('print(%d)\n' % i)
+    with open('common.py', 'w') as fd:
+      fd.write('print("common")\n')
+
+    async def run(s):
+      await s.submit()
+      return await s.wait_for_result(refresh_time = 0.01)
+
+    submissions = [self.submission(f, chunked_upload = i % 2 == 1) for i, f in enumerate(filenames)]
+
+    async def run_all():
+      return await asyncio.gather(*[run(s) for s in submissions])
+
+    results = asyncio.run(run_all())
+
+    self.assertEqual(results, [{'files': sorted(f)} for f in filenames])
+    self.assertEqual([s.poll_count for s in submissions], [3] * len(submissions))
+    self.assertFalse(os.path.exists('student.zip'))
+
+  def test_wait_times_out(self):
+    """wait_for_result gives up after the timeout"""
+    with open('student_file.py', 'w') as fd:
+      fd.write('print("hello")\n')
+
+    self.standin.pending_polls = 1000
+    s = self.submission(['student_file.py'], stream_upload = True)
+
+    async def run():
+      await s.submit()
+      await s.wait_for_result(refresh_time = 0.01, timeout = 0.2)
+
+    with self.assertRaises(asyncio.TimeoutError):
+      asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
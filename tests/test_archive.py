@@ -0,0 +1,290 @@
+import unittest
+import os
+import shutil
+import json
+import ntpath
+import zipfile
+import warnings
+import mock
+
+import nelson.archivecache
+from nelson.abstract import mkzip
+from nelson.archivecache import ArchiveCache
+from nelson.archive import zip_entries, file_manifest, write_zip, plan_entries, estimate_zip_size, preflight, SizeGuard
+from nelson.archive import expand_duplicates, DEDUP_MANIFEST
+from nelson.compression import AdaptivePolicy
+from standin_case import TempDirTestCase
+
+class TestArchive(TempDirTestCase):
+
+  def create_files(self, filenames, nbytes, random = True):
+    for f in filenames:
+      with open(f, "wb") as fd:
+        if random:
+          fd.write(os.urandom(nbytes))
+        else:
+          fd.write((f * nbytes)[:nbytes].encode('utf-8'))
+
+  def read(self, filename):
+    with open(filename, "rb") as fd:
+      return fd.read()
+
+  def test_parallel_matches_serial(self):
+    """Parallel compression produces the same bytes as a serial run"""
+    filenames = ['random%d.bin' % i for i in range(3)] + ['text%d.txt' % i for i in range(3)]
+    self.create_files(filenames[:3], 1 << 20)
+    self.create_files(filenames[3:], 1 << 20, random = False)
+
+    entries = zip_entries('', filenames)
+    write_zip('serial.zip', entries, compression = zipfile.ZIP_DEFLATED, workers = 1)
+    write_zip('parallel.zip', entries, compression = zipfile.ZIP_DEFLATED, workers = 2)
+
+    self.assertEqual(self.read('serial.zip'), self.read('parallel.zip'))
+
+    with zipfile.ZipFile('parallel.zip') as z:
+      self.assertIsNone(z.testzip())
+
+  def test_falls_back_without_zipfile_internals(self):
+    """Without zipfile's private helpers, workers and the cache still give the serial bytes"""
+    filenames = ['random%d.bin' % i for i in range(3)]
+    self.create_files(filenames, 2 << 20)
+    entries = zip_entries('', filenames)
+    write_zip('serial.zip', entries, compression = zipfile.ZIP_DEFLATED, workers = 1)
+
+    with mock.patch('nelson.archive._zip_internals', False), \
+         mock.patch('nelson.archivecache._compress_file') as compress:
+      write_zip('parallel.zip', entries, compression = zipfile.ZIP_DEFLATED, workers = 2)
+      mkzip('', 'cached.zip', filenames, 16 << 20, compression = zipfile.ZIP_DEFLATED,
+            cache = ArchiveCache(os.path.join(self.tmp_path, 'cache')))
+      self.assertEqual(compress.call_count, 0)
+
+    self.assertEqual(self.read('serial.zip'), self.read('parallel.zip'))
+    self.assertEqual(self.read('serial.zip'), self.read('cached.zip'))
+
+  def test_mmap_matches_zipfile(self):
+    """Memory-mapped reads produce the same archive as ZipFile.write"""
+    filenames = ['random.bin', 'text.txt']
+    self.create_files(filenames[:1], 3 << 20)
+    self.create_files(filenames[1:], 3 << 20, random = False)
+
+    for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+      with zipfile.ZipFile('reference.zip', 'w', compression) as z:
+        for f in filenames:
+          z.write(f, f)
+
+      with mock.patch('nelson.archive.MMAP_MIN_SIZE', 1 << 20):
+        write_zip('serial.zip', zip_entries('', filenames), compression = compression)
+        write_zip('parallel.zip', zip_entries('', filenames), compression = compression, workers = 2)
+
+      self.assertEqual(self.read('reference.zip'), self.read('serial.zip'))
+      self.assertEqual(self.read('reference.zip'), self.read('parallel.zip'))
+
+  def test_serial_matches_zipfile(self):
+    """The serial writer produces the same bytes as ZipFile.write"""
+    filenames = ['text%d.txt' % i for i in range(3)]
+    self.create_files(filenames, 1 << 16, random = False)
+
+    with zipfile.ZipFile('reference.zip', 'w', zipfile.ZIP_DEFLATED) as z:
+      for f in filenames:
+        z.write(f, f)
+    write_zip('serial.zip', zip_entries('', filenames), compression = zipfile.ZIP_DEFLATED)
+
+    self.assertEqual(self.read('reference.zip'), self.read('serial.zip'))
+
+  def test_rejects_before_writing(self):
+    """Stored archives that cannot fit are rejected before anything is written"""
+    filenames = ['random%d.bin' % i for i in range(2)]
+    self.create_files(filenames, 1 << 16)
+
+    with self.assertRaises(ValueError) as cm:
+      mkzip('', 'student.zip', filenames, 1 << 16)
+
+    self.assertEqual(str(cm.exception), "Your zipfile exceeded the limit of %d bytes" % (1 << 16))
+    self.assertFalse(os.path.exists('student.zip'))
+
+  def test_stops_writing_early(self):
+    """Compressed archives stop growing once they are certain to be too large"""
+    filenames = ['random%d.bin' % i for i in range(4)]
+    self.create_files(filenames, 1 << 20)
+    entries = zip_entries('', filenames)
+
+    with self.assertRaises(ValueError):
+      write_zip('student.zip', entries, compression = zipfile.ZIP_DEFLATED, max_zip_size = 3 << 19)
+
+    with zipfile.ZipFile('student.zip') as z:
+      self.assertLess(len(z.namelist()), len(filenames))
+
+  def test_estimates_size(self):
+    """Pre-flight estimates are close to the real archive size"""
+    filenames = ['random.bin', 'text.txt']
+    self.create_files(filenames[:1], 1 << 18)
+    self.create_files(filenames[1:], 1 << 18, random = False)
+    entries = zip_entries('', filenames)
+
+    for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+      planned = plan_entries(entries, compression)
+      write_zip('student.zip', planned)
+      actual = os.path.getsize('student.zip')
+      estimate = estimate_zip_size(planned)
+      self.assertLess(abs(estimate - actual), actual * 0.1)
+
+    planned = plan_entries(entries, zipfile.ZIP_STORED)
+    self.assertEqual(SizeGuard(planned, None).lower_bound(0), estimate_zip_size(planned))
+
+  def test_preflight_samples_whole_files(self):
+    """A random header doesn't make a file of zeros look incompressible"""
+    with open('data.bin', 'wb') as fd:
+      fd.write(os.urandom(64 << 10))
+      fd.write(b'\0' * (4 << 20))
+    planned = plan_entries(zip_entries('', ['data.bin']), zipfile.ZIP_DEFLATED)
+
+    with warnings.catch_warnings():
+      warnings.simplefilter('error')
+      preflight(planned, 1 << 20)
+    write_zip('student.zip', planned, max_zip_size = 1 << 20)
+    self.assertLess(os.path.getsize('student.zip'), 1 << 20)
+
+  def test_preflight_only_warns_on_estimates(self):
+    """An estimate over the limit is a warning; the build itself proves it"""
+    self.create_files(['random.bin'], 1 << 20)
+    planned = plan_entries(zip_entries('', ['random.bin']), zipfile.ZIP_DEFLATED)
+
+    with self.assertWarns(UserWarning):
+      preflight(planned, 1 << 18)
+    with self.assertRaises(ValueError):
+      write_zip('student.zip', planned, max_zip_size = 1 << 18)
+
+  def test_adaptive_policy(self):
+    """The adaptive policy stores incompressible files and deflates the rest"""
+    filenames = ['random.bin', 'text.txt', 'image.png']
+    self.create_files(['random.bin'], 1 << 14)
+    self.create_files(['text.txt', 'image.png'], 1 << 14, random = False)
+
+    policy = AdaptivePolicy(compresslevel = 9)
+    self.assertEqual([policy.choose(f) for f in filenames],
+                     [(zipfile.ZIP_STORED, None), (zipfile.ZIP_DEFLATED, 9), (zipfile.ZIP_STORED, None)])
+
+    mkzip('', 'student.zip', filenames, 1 << 20, compression = policy)
+    with zipfile.ZipFile('student.zip') as z:
+      self.assertIsNone(z.testzip())
+      self.assertEqual([i.compress_type for i in z.infolist()],
+                       [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+
+    policy = AdaptivePolicy(strong_compress_type = zipfile.ZIP_LZMA, strong_min_size = 1 << 10)
+    self.assertEqual(policy.choose('text.txt'), (zipfile.ZIP_LZMA, None))
+
+  def test_cache_reuses_archives(self):
+    """Cached archives are reused and only changed entries are recompressed"""
+    filenames = ['text%d.txt' % i for i in range(3)]
+    self.create_files(filenames, 1 << 14, random = False)
+
+    write_zip('reference.zip', zip_entries('', filenames), compression = zipfile.ZIP_DEFLATED)
+
+    cache = ArchiveCache(os.path.join(self.tmp_path, 'cache'))
+    compress = mock.Mock(wraps = nelson.archivecache._compress_file)
+    with mock.patch('nelson.archivecache._compress_file', compress):
+      mkzip('', 'student.zip', filenames, 1 << 20, compression = zipfile.ZIP_DEFLATED, cache = cache)
+      self.assertEqual(self.read('student.zip'), self.read('reference.zip'))
+      self.assertEqual(compress.call_count, 3)
+
+      os.unlink('student.zip')
+      cache = ArchiveCache(os.path.join(self.tmp_path, 'cache'))
+      mkzip('', 'student.zip', filenames, 1 << 20, compression = zipfile.ZIP_DEFLATED, cache = cache)
+      self.assertEqual(self.read('student.zip'), self.read('reference.zip'))
+      self.assertEqual((cache.hits, cache.misses), (1, 0))
+      self.assertEqual(compress.call_count, 3)
+
+      with open('text1.txt', 'ab') as fd:
+        fd.write(b'changed')
+      mkzip('', 'student.zip', filenames, 1 << 20, compression = zipfile.ZIP_DEFLATED, cache = cache)
+      self.assertEqual(compress.call_count, 4)
+
+    write_zip('reference.zip', zip_entries('', filenames), compression = zipfile.ZIP_DEFLATED)
+    self.assertEqual(self.read('student.zip'), self.read('reference.zip'))
+
+  def test_cache_evicts_least_recently_used(self):
+    """The cache stays under its size cap"""
+    filenames = ['random%d.bin' % i for i in range(3)]
+    self.create_files(filenames, 1 << 14)
+
+    cache = ArchiveCache(os.path.join(self.tmp_path, 'cache'), max_bytes = 3 << 14)
+    for f in filenames:
+      mkzip('', 'student.zip', [f], 1 << 20, cache = cache)
+
+    items = cache.index['items']
+    self.assertLessEqual(sum(item['size'] for item in items.values()), 3 << 14)
+    self.assertEqual(len(os.listdir(os.path.join(self.tmp_path, 'cache', 'items'))), len(items))
+
+  def test_deduplicates_contents(self):
+    """Duplicate files are stored once and restored by expand_duplicates"""
+    filenames = ['a.bin', 'b.bin', 'copy_of_a.bin', 'another_copy_of_a.bin']
+    self.create_files(filenames[:2], 1 << 16)
+    shutil.copyfile('a.bin', 'copy_of_a.bin')
+    shutil.copyfile('a.bin', 'another_copy_of_a.bin')
+
+    #Too large unless the copies are left out
+    mkzip('', 'student.zip', filenames, 3 << 16, dedupe = True)
+
+    with zipfile.ZipFile('student.zip') as z:
+      self.assertEqual(z.namelist(), ['a.bin', 'b.bin', DEDUP_MANIFEST])
+
+    expand_duplicates('student.zip', 'expanded.zip')
+    with zipfile.ZipFile('expanded.zip') as z:
+      self.assertEqual(sorted(z.namelist()), sorted(filenames))
+      for f in filenames:
+        self.assertEqual(z.read(f), self.read(f))
+
+  def test_archive_names_use_slashes(self):
+    """Archive names use '/' even where the path separator is '\\'"""
+    with mock.patch('os.path', ntpath):
+      entries = zip_entries('C:\\project', ['C:\\project\\lib\\util.py', 'C:\\project\\main.py'])
+    self.assertEqual([arcname for _, arcname in entries], ['lib/util.py', 'main.py'])
+
+  def test_rejects_sibling_directories(self):
+    """A directory that merely starts with the root's name is outside it"""
+    os.makedirs('proj')
+    os.makedirs('proj2')
+    self.create_files([os.path.join('proj2', 'x.py')], 1 << 10)
+
+    with self.assertRaises(ValueError):
+      zip_entries('proj', [os.path.join('proj2', 'x.py')])
+    with self.assertRaises(ValueError):
+      mkzip('proj', 'student.zip', [os.path.join('proj2', 'x.py')], 1 << 20)
+
+  def test_manifest_paths_use_slashes(self):
+    """Incremental manifests name files as the zip would, with '/'"""
+    os.makedirs('lib')
+    self.create_files([os.path.join('lib', 'util.py')], 1 << 10)
+
+    manifest = file_manifest(zip_entries('', [os.path.join('lib', 'util.py')]))
+    self.assertEqual([f['path'] for f in manifest], ['lib/util.py'])
+
+  def test_deduplicates_in_subdirectories(self):
+    """Duplicates in subdirectories are listed and restored under their zip names"""
+    os.makedirs(os.path.join('lib', 'sub'))
+    filenames = [os.path.join('lib', 'a.bin'), os.path.join('lib', 'sub', 'copy.bin')]
+    self.create_files(filenames[:1], 1 << 12)
+    shutil.copyfile(filenames[0], filenames[1])
+
+    mkzip('', 'student.zip', filenames, 1 << 20, dedupe = True)
+    with zipfile.ZipFile('student.zip') as z:
+      self.assertEqual(json.loads(z.read(DEDUP_MANIFEST).decode('utf-8'))['duplicates'], {'lib/sub/copy.bin': 'lib/a.bin'})
+
+    expand_duplicates('student.zip', 'expanded.zip')
+    with zipfile.ZipFile('expanded.zip') as z:
+      self.assertEqual(sorted(z.namelist()), ['lib/a.bin', 'lib/sub/copy.bin'])
+
+  def test_mkzip_workers(self):
+    """mkzip accepts a worker count and still enforces the size limit"""
+    filenames = ['random%d.bin' % i for i in range(4)]
+    self.create_files(filenames, 2 << 20)
+
+    mkzip('', 'student.zip', filenames, 16 << 20, workers = 2)
+    with zipfile.ZipFile('student.zip') as z:
+      self.assertEqual(z.namelist(), filenames)
+
+    with self.assertRaises(ValueError):
+      mkzip('', 'student.zip', filenames, 1 << 20, workers = 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import requests
+import json
+
+from nelson.batch import load_manifest, build_submissions, run_batch
+from nelson.polling import PollScheduler
+from nelson.standin import Submission
+from standin_case import StandinTestCase
+
+class TestBatch(StandinTestCase):
+
+  def standin_options(self):
+    return {'pending_polls': 1}
+
+  def test_runs_submissions_concurrently(self):
+    """Every submission is graded and timed, and a bad one fails on its own"""
+    session = requests.Session()
+    submissions = []
+    for i in range(6):
+      os.mkdir('quiz%d' % i)
+      with open(os.path.join('quiz%d' % i, 'solution.py'), 'w') as fd:
+        fd.write('print(%d)\n' % i)
+      submissions.append(('quiz%d' % i, Submission(self.standin.url, session, [os.path.join('quiz%d' % i, 'solution.py')],
+                                                   zipfile_root = 'quiz%d' % i, quiz_name = 'quiz%d' % i)))
+    submissions.append(('bad', Submission(self.standin.url, session, ['quiz0/solution.py'], zipfile_root = 'quiz1')))
+
+    report = run_batch(submissions, workers = 3,
+                       scheduler_factory = lambda: PollScheduler(initial = 0.01, jitter = 0.))
+
+    self.assertEqual(report['counts'], {'graded': 6, 'error': 0, 'failed': 1})
+    for r in report['results'][:6]:
+      self.assertEqual(r['feedback'], {'files': ['solution.py']})
+      self.assertEqual(r['poll_count'], 2)
+      self.assertEqual(sorted(r['timings']), ['upload', 'wait', 'zip'])
+    self.assertTrue(report['results'][6]['error'].startswith('upload: Submitted files must in subdirectories'))
+    self.assertEqual(sorted(report['timings']), ['upload', 'wait', 'zip'])
+    self.assertEqual(len(self.standin.submissions), 6)
+    self.assertFalse(os.path.exists('student.zip'))
+
+  def test_manifest(self):
+    """Manifest entries become gtomscs or udacity submissions rooted at the manifest"""
+    os.mkdir('p1')
+    for f in ['a.py', 'p1/b.py']:
+      with open(f, 'w') as fd:
+        fd.write('pass\n')
+    with open('manifest.json', 'w') as fd:
+      json.dump({'submissions': [{'gtcode': 'cs101', 'quiz': 'q1', 'files': ['a.py']},
+                                 {'nanodegree': 'nd1', 'project': 'p1', 'files': ['b.py'],
+                                  'root': 'p1', 'dedupe': True}]}, fd)
+
+    (gt_name, gt), (ud_name, ud) = build_submissions(load_manifest('manifest.json'),
+                                                     {'gtomscs': None, 'udacity': None})
+
+    self.assertEqual((gt_name, ud_name), ('cs101/q1', 'nd1/p1'))
+    self.assertEqual(gt.filenames, [os.path.join(self.tmp_path, 'a.py')])
+    self.assertEqual(ud.zipfile_root, os.path.join(self.tmp_path, 'p1'))
+    self.assertTrue(ud.dedupe)
+    self.assertEqual(ud._get_submit_url(), 'https://project-assistant.udacity.com/student/nanodegree/nd1/project/p1/submission')
+
+    with open('manifest.json', 'w') as fd:
+      json.dump({'submissions': [{'quiz': 'q1', 'files': ['a.py']}]}, fd)
+    with self.assertRaises(ValueError):
+      load_manifest('manifest.json')
+
+if __name__ == '__main__':
+    unittest.main()
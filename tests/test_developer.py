@@ -2,8 +2,6 @@ import mock
 import unittest
 import os
 import sys
-import shutil
-import tempfile
 import requests
 import requests_mock
 import json
@@ -12,19 +10,11 @@ from collections import namedtuple
 import nelson.developer
 import nelson.gtomscs
 import nelson.udacity
+from standin_case import TempDirTestCase
 
 ArgSet = namedtuple('ArgSet',['action', 'object', 'data_file', 'environment', 'id_provider', 'jwt_path'])
 
-class TestDeveloper(unittest.TestCase):
-  def setUp(self):
-    self.tmp_path = tempfile.mkdtemp()
-    self.cwd = os.getcwd()
-    os.chdir(self.tmp_path)
-
-  def tearDown(self):
-    os.chdir(self.cwd)
-    shutil.rmtree(self.tmp_path) 
-
+class TestDeveloper(TempDirTestCase):
   def checkDeployKeyCreated(self):
     self.assertTrue(os.path.isfile('deploy_key/deploy_id_rsa'))
 
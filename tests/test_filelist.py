@@ -0,0 +1,76 @@
+import unittest
+import os
+
+from nelson.filelist import expand_filenames, IgnoreRules
+from standin_case import TempDirTestCase
+
+class TestFilelist(TempDirTestCase):
+
+  def setUp(self):
+    super(TestFilelist, self).setUp()
+
+    for f in ['project/main.py', 'project/util/helpers.py', 'project/util/helpers.pyc',
+              'project/data/train.csv', 'project/node_modules/left-pad/index.js',
+              'project/.git/HEAD', 'project/build/out.o', 'project/notes.txt']:
+      if not os.path.isdir(os.path.dirname(f)):
+        os.makedirs(os.path.dirname(f))
+      with open(f, 'w') as fd:
+        fd.write(f)
+
+  def test_expands_directories(self):
+    """Directories are walked with the default excludes pruned"""
+    self.assertEqual(expand_filenames(['project']),
+                     [os.path.join('project', 'data', 'train.csv'),
+                      os.path.join('project', 'main.py'),
+                      os.path.join('project', 'notes.txt'),
+                      os.path.join('project', 'util', 'helpers.py')])
+
+  @unittest.skipUnless(hasattr(os, 'symlink'), "needs symlinks")
+  def test_walk_skips_symlinks(self):
+    """Links out of the tree aren't followed, but can be named explicitly"""
+    with open('secret.txt', 'w') as fd:
+      fd.write('secret')
+    link = os.path.join('project', 'data', 'secret.csv')
+    os.symlink(os.path.abspath('secret.txt'), link)
+    os.symlink(self.tmp_path, os.path.join('project', 'outside'))
+
+    self.assertNotIn(link, expand_filenames(['project']))
+    self.assertEqual(expand_filenames([link]), [link])
+
+  def test_expands_globs(self):
+    """Glob patterns are expanded and filtered, explicit files are kept"""
+    self.assertEqual(expand_filenames(['project/**/*.py', 'project/build/out.o']),
+                     ['project/main.py', 'project/util/helpers.py', 'project/build/out.o'])
+
+  def test_existing_files_with_glob_characters(self):
+    """A file whose name looks like a pattern is submitted as is"""
+    with open('sol[1].py', 'w') as fd:
+      fd.write('pass')
+    self.assertEqual(expand_filenames(['sol[1].py']), ['sol[1].py'])
+
+  def test_unmatched_glob(self):
+    """A pattern that matches nothing is an error rather than silently dropped"""
+    with self.assertRaises(ValueError):
+      expand_filenames(['project/*.java'])
+
+  def test_custom_excludes(self):
+    """Anchored, negated and directory-only patterns follow .gitignore rules"""
+    excludes = ['/data/', '*.txt', '!notes.txt', 'util/']
+    self.assertEqual(expand_filenames(['project'], excludes),
+                     [os.path.join('project', '.git', 'HEAD'),
+                      os.path.join('project', 'build', 'out.o'),
+                      os.path.join('project', 'main.py'),
+                      os.path.join('project', 'node_modules', 'left-pad', 'index.js'),
+                      os.path.join('project', 'notes.txt')])
+
+  def test_ignore_rules(self):
+    """Wildcards and anchors match like .gitignore"""
+    rules = IgnoreRules(['**/cache/**', 'a?c.[ch]', '/top.txt'])
+    self.assertTrue(rules.ignored('x/cache/y/z', False))
+    self.assertTrue(rules.ignored('src/abc.h', False))
+    self.assertFalse(rules.ignored('src/abbc.h', False))
+    self.assertTrue(rules.ignored('top.txt', False))
+    self.assertFalse(rules.ignored('sub/top.txt', False))
+
+if __name__ == '__main__':
+    unittest.main()
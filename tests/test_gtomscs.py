@@ -7,7 +7,13 @@ import requests_mock
 import nelson
 import zipfile
 import json
+import io
+import re
+import warnings
+import mock
 
+import nelson.gtomscs
+import nelson.udacity
 from nelson.gtomscs import Submission
 
 class TestGTOMSCS(unittest.TestCase):
@@ -47,6 +53,71 @@ class TestGTOMSCS(unittest.TestCase):
     for f in filenames:
       os.unlink(f)
 
+  def read_streamed_zip(self, request):
+    body = b''.join(request.body)
+    boundary = re.search('boundary=(.*)', request.headers['Content-Type']).group(1).encode('utf-8')
+    part = body.split(b'--' + boundary)[1]
+    return part.split(b'\r\n\r\n', 1)[1][:-2]
+
+  def test_streams_upload(self):
+    """Streams a valid zipfile without writing it to disk"""
+    filenames = ['student_file1.py', 'student_file2.py']
+
+    self.create_randomfiles(filenames, 1 << 10)
+
+    received = {}
+    def on_post(request, context):
+      received['zip'] = self.read_streamed_zip(request)
+      return json.dumps({})
+
+    with requests_mock.Mocker() as m:
+      m.post('https://bonnie.udacity.com/student/course/csXXXX/quiz/letsmakeadeal/submission',
+             text=on_post)
+
+      s = Submission('csXXXX', 'letsmakeadeal', requests.Session(), filenames, 
+                      max_zip_size = 4 << 10,
+                      environment = 'production',
+                      stream_upload = True).submit()
+
+    self.assertFalse(os.path.exists('student.zip'))
+
+    with zipfile.ZipFile(io.BytesIO(received['zip']), 'r') as z:
+      self.assertIsNone(z.testzip())
+      self.assertEqual(sorted(z.namelist()), sorted(filenames))
+
+    for f in filenames:
+      os.unlink(f)
+
+  def test_stream_rejects_too_large(self):
+    """Stops a streamed upload once it exceeds the limit"""
+    filenames = ['student_file1.py', 'student_file2.py', 'student_file3.py', 'student_file4.py']
+
+    #Random data doesn't deflate, so only the build itself can tell the zip is too large
+    self.create_randomfiles(filenames, 64 << 10)
+
+    max_zip_size = 100 << 10
+
+    sent = []
+    with requests_mock.Mocker() as m:
+      m.post('https://bonnie.udacity.com/student/course/csXXXX/quiz/letsmakeadeal/submission',
+             text=lambda request, context: self.read_streamed_zip(request))
+
+      with self.assertRaises(ValueError) as cm, warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        s = Submission('csXXXX', 'letsmakeadeal', requests.Session(), filenames, 
+                        max_zip_size = max_zip_size,
+                        environment = 'production',
+                        upload_progress_callback = lambda monitor: sent.append(monitor.bytes_read),
+                        stream_upload = True).submit()
+
+    self.assertEqual(str(cm.exception), "Your zipfile exceeded the limit of %d bytes" % max_zip_size)
+    #Partway through the body: past the first file, short of the last
+    self.assertGreater(sent[-1], 64 << 10)
+    self.assertLess(sent[-1], 3 * (64 << 10))
+
+    for f in filenames:
+      os.unlink(f)
+
   def test_rejects_too_large(self):
     """Rejects zipfiles that are too large"""
     filenames = ['student_file1.py', 'student_file2.py']
@@ -65,6 +136,13 @@ class TestGTOMSCS(unittest.TestCase):
     for f in filenames:
       os.unlink(f)
 
+  def test_build_session_passes_validation_ttl(self):
+    """Course scripts can set how long a validated token is trusted"""
+    for module in [nelson.gtomscs, nelson.udacity]:
+      with mock.patch.object(module, 'SessionBuilder') as builder:
+        module.build_session('production', jwt_path = 'jwt', validation_ttl = 60)
+      self.assertEqual(builder.call_args[1]['validation_ttl'], 60)
+
   def test_rejects_parent_path(self):
     """Rejects filenames that involve parents in path"""
     filenames = ['student_file1.py', './../student_file2.py']
@@ -0,0 +1,64 @@
+import unittest
+import os
+import io
+import requests
+import mock
+
+import nelson.abstract
+from nelson.polling import PollScheduler, parse_retry_after
+from nelson.standin import BonnieStandin, Submission
+from standin_case import TempDirTestCase
+
+class TestPollScheduler(unittest.TestCase):
+
+  def test_backs_off_exponentially(self):
+    """Delays grow by the factor up to the maximum"""
+    scheduler = PollScheduler(initial = 2., factor = 2., max_interval = 10., jitter = 0.)
+    self.assertEqual([scheduler.next_delay() for _ in range(5)], [2., 4., 8., 10., 10.])
+
+  def test_jitter(self):
+    """Jitter spreads delays around the backoff interval"""
+    low = PollScheduler(initial = 10., jitter = 0.2, rng = lambda: 0.)
+    high = PollScheduler(initial = 10., jitter = 0.2, rng = lambda: 1.)
+    self.assertAlmostEqual(low.next_delay(), 8.)
+    self.assertAlmostEqual(high.next_delay(), 12.)
+
+  def test_honors_server_hints(self):
+    """Retry-After is a floor and an estimated completion replaces the backoff"""
+    scheduler = PollScheduler(initial = 3., jitter = 0.)
+    self.assertEqual(scheduler.next_delay(retry_after = 20.), 20.)
+    self.assertEqual(scheduler.next_delay(eta = 7.), 7.)
+    self.assertEqual(scheduler.next_delay(eta = 600.), 60.)
+    self.assertEqual(scheduler.next_delay(retry_after = 30., eta = 7.), 30.)
+
+  def test_parses_retry_after(self):
+    self.assertEqual(parse_retry_after('120'), 120.)
+    self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.)
+    self.assertIsNone(parse_retry_after('soon'))
+    self.assertIsNone(parse_retry_after(None))
+
+class TestSubmitPolling(TempDirTestCase):
+
+  def setUp(self):
+    super(TestSubmitPolling, self).setUp()
+
+    with open('student_file.py', 'w') as fd:
+      fd.write('print("hello")\n')
+
+  def test_submit_counts_polls_and_honors_retry_after(self):
+    """abstract.submit waits out throttling and reports the polls it used"""
+    with BonnieStandin(pending_polls = 2, eta_seconds = 1, throttled_polls = 1, retry_after = 5) as standin:
+      s = Submission(standin.url, requests.Session(), ['student_file.py'], zipfile_root = '')
+
+      with mock.patch('nelson.abstract.time.sleep') as sleep, \
+           mock.patch('sys.stdout', new_callable = io.StringIO) as stdout:
+        nelson.abstract.submit(s)
+
+    self.assertEqual(s.poll_count, 4)
+    self.assertIn("Done! (4 status checks)", stdout.getvalue())
+
+    #5 s after the 429, then the 1 s estimate twice, in 1/8 s spinner steps
+    self.assertEqual(sleep.call_count, (5 + 1 + 1) * 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import os
+import io
+import sys
+import shutil
+import requests
+import mock
+
+import nelson
+import nelson.abstract
+from nelson.precheck import Precheck, PrecheckFailed, PrecheckError
+from nelson.standin import Submission
+from standin_case import StandinTestCase
+
+#Checks that workspace/hello.py exists and compiles
+GRADER = """
+import os, sys, json, py_compile
+os.chdir('workspace')
+tests = []
+for name in ['hello.py']:
+  traceback = ''
+  try:
+    py_compile.compile(name, doraise = True)
+  except Exception as e:
+    traceback = str(e)
+  tests.append({'description': 'Checks that %s compiles' % name, 'traceback': traceback,
+                'output': {'points_available': 5, 'points_awarded': 0 if traceback else 5}})
+with open('grade.json', 'w') as fd:
+  json.dump({'tests': tests}, fd)
+"""
+
+class TestPrecheck(StandinTestCase):
+
+  def setUp(self):
+    super(TestPrecheck, self).setUp()
+
+    os.makedirs(os.path.join('grader', 'workspace'))
+    self.write(os.path.join('grader', 'precheck.py'), GRADER)
+
+  def write(self, filename, text):
+    with open(filename, 'w') as fd:
+      fd.write(text)
+
+  def submit(self, filenames, precheck):
+    s = Submission(self.standin.url, requests.Session(), filenames, zipfile_root = '')
+    out = io.StringIO()
+    with mock.patch('sys.stdout', out), mock.patch('nelson.abstract.time.sleep'):
+      nelson.abstract.submit(s, refresh_time = 0.01, precheck = precheck, result_writer = mock.Mock())
+    return out.getvalue()
+
+  def test_passing_submission_is_uploaded(self):
+    self.write('hello.py', 'print("hello")\n')
+    precheck = Precheck('grader')
+
+    feedback = precheck.run('', ['hello.py'])
+    self.assertEqual(feedback['tests'][0]['output']['points_awarded'], 5)
+
+    output = self.submit(['hello.py'], precheck)
+    self.assertIn('Running local checks...passed.', output)
+    self.assertEqual(len(self.standin.submissions), 1)
+
+  def test_failing_submission_is_not_uploaded(self):
+    """A failed check is reported without uploading anything"""
+    self.write('hello.py', 'print("hello"\n')
+    precheck = Precheck('grader')
+
+    with self.assertRaises(PrecheckFailed) as cm:
+      precheck.run('', ['hello.py'])
+    self.assertEqual(str(cm.exception), '1 of 1 local checks failed')
+
+    output = self.submit(['hello.py'], precheck)
+    self.assertIn('failed: 1 of 1 local checks failed', output)
+    self.assertIn('Checks that hello.py compiles:', output)
+    self.assertIn('0/5', output)
+    self.assertEqual(self.standin.submissions, {})
+
+  def test_missing_file_fails(self):
+    self.write('other.py', 'pass\n')
+    with self.assertRaises(PrecheckFailed) as cm:
+      Precheck('grader').run('', ['other.py'])
+    self.assertEqual(len(cm.exception.feedback['tests']), 1)
+
+  def test_crashing_script_fails(self):
+    self.write(os.path.join('grader', 'precheck.py'), 'raise SystemExit("no compiler")\n')
+    self.write('hello.py', 'pass\n')
+    with self.assertRaises(PrecheckFailed) as cm:
+      Precheck('grader').run('', ['hello.py'])
+    self.assertIn('exited with status 1', str(cm.exception))
+    self.assertIn('no compiler', cm.exception.output)
+
+  def test_slow_or_missing_checks_are_skipped(self):
+    """Checks that can't finish don't hold the submission back"""
+    self.write(os.path.join('grader', 'precheck.py'), 'import time\ntime.sleep(30)\n')
+    self.write('hello.py', 'pass\n')
+    with self.assertRaises(PrecheckError):
+      Precheck('grader', timeout = 0.5).run('', ['hello.py'])
+    with self.assertRaises(PrecheckError):
+      Precheck('nowhere').run('', ['hello.py'])
+
+    output = self.submit(['hello.py'], Precheck('grader', timeout = 0.5))
+    self.assertIn('skipped (local checks did not finish within 0.5 seconds)', output)
+    self.assertEqual(len(self.standin.submissions), 1)
+
+  def test_checks_that_cannot_start_are_skipped(self):
+    self.write('hello.py', 'pass\n')
+    missing_python = os.path.join(self.tmp_path, 'no-such-python')
+    with self.assertRaises(PrecheckError):
+      Precheck('grader', python = missing_python).run('', ['hello.py'])
+    with self.assertRaises(PrecheckError):
+      Precheck('grader').run('', ['hello.py', 'missing.py'])
+
+    output = self.submit(['hello.py'], Precheck('grader', python = missing_python))
+    self.assertIn('skipped (could not start %s' % missing_python, output)
+    self.assertEqual(len(self.standin.submissions), 1)
+
+  @unittest.skipUnless(shutil.which('gcc'), "needs gcc")
+  def test_sample_precheck(self):
+    """The sample project's precheck compiles the student's code"""
+    sample = os.path.join(os.path.dirname(nelson.__file__), 'clyde_sample')
+    for name in ['main.c', 'helloworld.c']:
+      shutil.copy(os.path.join(sample, 'workspace', name), name)
+
+    feedback = Precheck(sample).run('', ['main.c', 'helloworld.c'])
+    self.assertEqual([t['output']['points_awarded'] for t in feedback['tests']], [5])
+
+    self.write('helloworld.c', 'syntax error')
+    with self.assertRaises(PrecheckFailed):
+      Precheck(sample).run('', ['main.c', 'helloworld.c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import os
+import gzip
+import json
+
+from nelson.results import ResultWriter, ResultLog
+from standin_case import TempDirTestCase
+
+class TestResults(TempDirTestCase):
+
+  def setUp(self):
+    super(TestResults, self).setUp()
+
+    self.feedback = {'tests': [{'name': 'test%d' % i, 'passed': i % 3 != 0} for i in range(100)]}
+
+  def test_writes_compact_files(self):
+    """Results are written compactly, optionally indented or gzipped"""
+    compact = ResultWriter().write('hello', self.feedback)
+    with open(compact) as fd:
+      text = fd.read()
+    self.assertEqual(text, json.dumps(self.feedback, separators = (',', ':')))
+    os.unlink(compact)
+
+    indented = ResultWriter(indent = 4).write('hello', self.feedback)
+    self.assertGreater(os.path.getsize(indented), len(text))
+    os.unlink(indented)
+
+    compressed = ResultWriter(compress = True).write('hello', self.feedback)
+    self.assertTrue(compressed.endswith('.json.gz'))
+    with gzip.open(compressed, 'rt') as fd:
+      self.assertEqual(json.load(fd), self.feedback)
+
+  def test_rotating_log(self):
+    """Logged results rotate at the size limit and page back in order"""
+    for compress, max_log_bytes in [(False, 4 << 10), (True, 1 << 9)]:
+      writer = ResultWriter(log = True, compress = compress, max_log_bytes = max_log_bytes, log_backups = 2)
+      for i in range(12):
+        filename = writer.write('hello', {'run': i, 'feedback': self.feedback})
+
+      log = ResultLog('hello', compress = compress, backups = 2)
+      self.assertEqual(log.files(), [filename + '.2', filename + '.1', filename])
+
+      runs = [r['feedback']['run'] for r in log]
+      self.assertEqual(runs, list(range(12 - len(runs), 12)))
+      self.assertLess(len(runs), 12)
+
+      self.assertEqual([r['feedback']['run'] for r in log.page(1, size = 2)], runs[2:4])
+      self.assertEqual(log.page(100), [])
+
+if __name__ == '__main__':
+    unittest.main()
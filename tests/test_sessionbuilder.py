@@ -5,10 +5,16 @@ import errno
 import requests
 import requests_mock
 import nelson
+import nelson.sessionbuilder
 import zipfile
 import json
+import time
+import base64
+import mock
 
-from nelson.sessionbuilder import SessionBuilder, udacity_login, gt_login
+from nelson.sessionbuilder import SessionBuilder, udacity_login, gt_login, connection_stats, jwt_expiry, DEFAULT_COMPRESS_MIN_SIZE
+from nelson.standin import Submission
+from standin_case import StandinTestCase
 
 class TestSessionBuilder(unittest.TestCase):
 
@@ -60,6 +66,163 @@ class TestSessionBuilder(unittest.TestCase):
             os.environ['GT_TEST_USERNAME'],
             os.environ['GT_TEST_PASSWORD'])
 
+class TestPooledSession(StandinTestCase):
+
+  def setUp(self):
+    super(TestPooledSession, self).setUp()
+
+    with open('jwt', 'w') as fd:
+      json.dump({'developer': 'token'}, fd)
+
+  def test_reuses_connections(self):
+    """Validation, submission and polling share one warm connection"""
+    session = SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.assertIs(SessionBuilder(self.standin.url, 'developer', 'jwt').session.adapters['http://'],
+                  session.adapters['http://'])
+    self.assertEqual(session.headers['authorization'], 'Bearer token')
+
+    with open('student_file.py', 'w') as fd:
+      fd.write('print("hello")\n')
+
+    s = Submission(self.standin.url, session, ['student_file.py'], zipfile_root = '')
+    s.submit()
+    self.assertTrue(s.poll())
+
+    self.assertEqual(connection_stats(session), {'connections': 1, 'requests': len(self.standin.requests)})
+
+  def test_builders_keep_their_own_credentials(self):
+    """Builders for one service share connections but not tokens, hooks or compression"""
+    with open('jwt', 'w') as fd:
+      json.dump({'developer': 'token', 'gt': 'other'}, fd)
+
+    developer = SessionBuilder(self.standin.url, 'developer', 'jwt', compress_requests = True).new()
+    gt = SessionBuilder(self.standin.url, 'gt', 'jwt').new()
+
+    self.assertEqual(developer.headers['authorization'], 'Bearer token')
+    self.assertEqual(gt.headers['authorization'], 'Bearer other')
+    self.assertEqual(len(developer.hooks['response']), 1)
+    self.assertEqual(len(gt.hooks['response']), 1)
+    self.assertEqual(developer.adapters['http://'].compress_min_size, DEFAULT_COMPRESS_MIN_SIZE)
+    self.assertIsNone(gt.adapters['http://'].compress_min_size)
+
+    gt.get(self.standin.url + '/users/me')
+    developer.get(self.standin.url + '/users/me')
+    self.assertEqual(connection_stats(gt)['connections'], 1)
+
+def make_jwt(**claims):
+  payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).decode('ascii').rstrip('=')
+  return 'e30.%s.signature' % payload
+
+class TestValidationCache(StandinTestCase):
+
+  def standin_options(self):
+    return {'accepted_tokens': [self.token]}
+
+  def setUp(self):
+    self.token = make_jwt(exp = time.time() + 86400)
+    super(TestValidationCache, self).setUp()
+
+    #Each test starts out like a new process
+    nelson.sessionbuilder._validated_tokens.clear()
+
+  def save(self, token):
+    with open('jwt', 'w') as fd:
+      json.dump({'developer': token}, fd)
+
+  def validations(self):
+    return self.standin.requests.count(('GET', '/users/me'))
+
+  def new_process(self):
+    nelson.sessionbuilder._validated_tokens.clear()
+
+  def test_decodes_expiry(self):
+    self.assertEqual(jwt_expiry(make_jwt(exp = 1234)), 1234)
+    self.assertIsNone(jwt_expiry(make_jwt(sub = 'me')))
+    self.assertIsNone(jwt_expiry('not a jwt'))
+
+  def test_skips_recent_validation(self):
+    """A saved token checked within the TTL is used without asking the service"""
+    self.save(self.token)
+
+    SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.assertEqual(self.validations(), 1)
+
+    self.new_process()
+    SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.assertEqual(self.validations(), 1)
+
+    self.new_process()
+    SessionBuilder(self.standin.url, 'developer', 'jwt', validation_ttl = 0).new()
+    self.assertEqual(self.validations(), 2)
+
+  def test_expiring_tokens_are_checked(self):
+    """A token about to expire is checked however recently it was validated"""
+    token = make_jwt(exp = time.time() + 10)
+    self.standin.accepted_tokens.append(token)
+    self.save(token)
+
+    SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.new_process()
+    SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.assertEqual(self.validations(), 2)
+
+  def test_reauthenticates_once_on_401(self):
+    """A token revoked after validation is replaced by one login and the request retried"""
+    for options in [{}, {'stream_upload': True}, {'incremental': True}]:
+      self.new_process()
+      self.check_reauthentication(options)
+
+  def check_reauthentication(self, options):
+    revoked = make_jwt(exp = time.time() + 86400, sub = 'revoked')
+    self.standin.accepted_tokens.append(revoked)
+    self.save(revoked)
+    SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    self.standin.accepted_tokens.remove(revoked)
+
+    builder = SessionBuilder(self.standin.url, 'developer', 'jwt')
+    with mock.patch.object(builder, 'login_for_jwt', return_value = self.token) as login, \
+         mock.patch('nelson.sessionbuilder.input', return_value = 'y'):
+      session = builder.new()
+      self.assertEqual(login.call_count, 0)
+
+      with open('student_file.py', 'w') as fd:
+        fd.write('print("hello")\n')
+      s = Submission(self.standin.url, session, ['student_file.py'], zipfile_root = '', **options)
+      s.submit()
+      self.assertTrue(s.poll())
+      self.assertEqual(s.feedback(), {'files': ['student_file.py']})
+
+    self.assertEqual(login.call_count, 1)
+    self.assertEqual(session.headers['authorization'], 'Bearer ' + self.token)
+    with open('jwt') as fd:
+      self.assertEqual(json.load(fd)['developer'], self.token)
+
+  def test_validates_each_token_once(self):
+    """Within a process a token is validated once, and every step is timed"""
+    self.save(self.token)
+    self.new_process()
+
+    steps = []
+    timing_hook = lambda step, seconds: steps.append(step)
+    SessionBuilder(self.standin.url, 'developer', 'jwt', validation_ttl = 0, timing_hook = timing_hook).new()
+    SessionBuilder(self.standin.url, 'developer', 'jwt', validation_ttl = 0, timing_hook = timing_hook).new()
+
+    self.assertEqual(steps, ['load', 'validate', 'load'])
+    self.assertEqual(self.validations(), 1)
+
+  def test_login_pipeline(self):
+    """Without a saved token: log in, mint a token and validate it once"""
+    steps = []
+    builder = SessionBuilder(self.standin.url, 'developer', 'jwt',
+                             timing_hook = lambda step, seconds: steps.append(step))
+    with mock.patch('nelson.sessionbuilder.input', side_effect = ['dev', 'n']), \
+         mock.patch('sys.stdout'):
+      session = builder.new()
+
+    self.assertEqual(steps, ['load', 'login', 'mint', 'validate'])
+    self.assertEqual(self.validations(), 1)
+    self.assertEqual(session.headers['authorization'], 'Bearer standin-token-1')
+
 if __name__ == '__main__':
     unittest.main()
 
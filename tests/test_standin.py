@@ -0,0 +1,244 @@
+import unittest
+import os
+import shutil
+import requests
+import json
+import time
+import mock
+import socket
+import warnings
+
+from nelson.standin import Submission
+from nelson.conditional import ResponseCache
+from nelson.sessionbuilder import enable_request_compression
+from standin_case import StandinTestCase
+
+class TestStandin(StandinTestCase):
+
+  def create_randomfiles(self, filenames, nbytes):
+    for f in filenames:
+      with open(f,"wb") as fd:
+        fd.write(os.urandom(nbytes))
+
+  def submission(self, filenames, **kwargs):
+    return Submission(self.standin.url, requests.Session(), filenames, zipfile_root = '', **kwargs)
+
+  def test_submits_and_polls(self):
+    """Uploads a zipfile to the stand-in and gets its file listing back"""
+    filenames = ['student_file1.py', 'student_file2.py']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    s = self.submission(filenames)
+    s.submit()
+
+    self.assertTrue(s.poll())
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_truncated_chunked_body(self):
+    """A chunked body that ends early gets a 400 rather than a crashed handler"""
+    for body in [b'5\r\nab', b'5\r\nabcde\r\n']:
+      sock = socket.create_connection(self.standin.httpd.server_address[:2])
+      try:
+        sock.sendall(b'POST /auth_tokens HTTP/1.1\r\nHost: localhost\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n' + body)
+        sock.shutdown(socket.SHUT_WR)
+        response = sock.makefile('rb').read()
+      finally:
+        sock.close()
+      self.assertTrue(response.startswith(b'HTTP/1.1 400 '), response)
+
+  def test_abandoned_stream_is_not_an_error(self):
+    """A client that stops streaming mid-body doesn't crash the handler"""
+    filenames = ['student_file%d.py' % i for i in range(4)]
+    self.create_randomfiles(filenames, 256 << 10)
+
+    with mock.patch.object(self.standin.httpd, 'handle_error') as handle_error:
+      for _ in range(3):
+        with self.assertRaises(ValueError), warnings.catch_warnings():
+          warnings.simplefilter('ignore')
+          self.submission(filenames, max_zip_size = 600 << 10, stream_upload = True).submit()
+      #Let the handlers notice the closed connections
+      time.sleep(0.5)
+    self.assertFalse(handle_error.called)
+
+  def test_deduplicated_submissions_are_expanded(self):
+    """The stand-in restores duplicates left out of the archive"""
+    filenames = ['student_file1.py', 'student_file2.py']
+    self.create_randomfiles(filenames[:1], 1 << 10)
+    shutil.copyfile(filenames[0], filenames[1])
+
+    for stream_upload in [False, True]:
+      s = self.submission(filenames, dedupe = True, stream_upload = stream_upload)
+      s.submit()
+
+      self.assertTrue(s.poll())
+      self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_incremental_uploads_only_changed_files(self):
+    """Incremental submissions only upload blobs the server lacks"""
+    filenames = ['student_file1.py', 'student_file2.py', 'data.bin']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    s = self.submission(filenames, incremental = True)
+    s.submit()
+    self.assertEqual(s.uploaded_blobs, 3)
+
+    self.create_randomfiles(['student_file1.py'], 1 << 10)
+
+    s = self.submission(filenames, incremental = True)
+    s.submit()
+    self.assertEqual(s.uploaded_blobs, 1)
+
+    self.assertTrue(s.poll())
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_chunked_upload_resumes(self):
+    """Chunked uploads resume from the server's offset after dropped connections"""
+    filenames = ['student_file1.py', 'student_file2.py']
+    self.create_randomfiles(filenames, 1 << 12)
+
+    self.standin.interrupted_chunks = 2
+
+    progress = []
+    s = self.submission(filenames, chunked_upload = True, upload_chunk_size = 1 << 10,
+                        upload_progress_callback = lambda m: progress.append((m.bytes_read, m.encoder.len)))
+    with mock.patch('nelson.resumable.time.sleep'):
+      s.submit()
+
+    self.assertEqual(s.upload_retries, 2)
+    self.assertEqual(progress[-1][0], progress[-1][1])
+    self.assertTrue(s.poll())
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_incremental_rejects_too_large(self):
+    """Incremental submissions check the size limit before uploading"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    with self.assertRaises(ValueError) as cm:
+      self.submission(filenames, incremental = True, max_zip_size = 1 << 9).submit()
+
+    self.assertEqual(str(cm.exception), "Your zipfile exceeded the limit of %d bytes" % (1 << 9))
+    self.assertEqual(self.standin.requests, [])
+
+  def test_listens_for_pushed_results(self):
+    """Results pushed over the event stream arrive without polling"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    self.standin.grading_time = 0.5
+    self.standin.heartbeat = 0.05
+
+    s = self.submission(filenames)
+    s.submit()
+    start = time.time()
+    self.assertTrue(s.listen())
+
+    self.assertLess(time.time() - start, 1.)
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+    self.assertEqual(s.poll_count, 0)
+    self.assertEqual([r for r in self.standin.requests if r[0] == 'GET'],
+                     [('GET', '/student/course/standin/quiz/standin/submission/1/events')])
+
+  def test_listen_falls_back_to_polling(self):
+    """Without an event stream, or when it times out, polling takes over"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    self.standin.pending_polls = 1
+    self.standin.heartbeat = 0.05
+
+    s = self.submission(filenames)
+    s.submit()
+    self.assertFalse(s.listen(timeout = 0.2))
+
+    self.standin.push_events = False
+    self.assertFalse(s.listen())
+
+    self.assertFalse(s.poll())
+    self.assertTrue(s.poll())
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_unchanged_polls_are_not_downloaded(self):
+    """Polls revalidate with If-None-Match and pending ones cost no body"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+
+    self.standin.pending_polls = 5
+    s = self.submission(filenames)
+    s.submit()
+
+    sent = self.standin.bytes_sent
+    polls = 0
+    while not s.poll():
+      polls += 1
+
+    #Only the first pending document and the graded one are sent
+    graded = self.standin.public(1)
+    pending = dict(graded, feedback = None)
+    self.assertEqual(polls, 5)
+    self.assertEqual(self.standin.not_modified, 4)
+    self.assertEqual(self.standin.bytes_sent - sent,
+                     len(json.dumps(pending).encode('utf-8')) + len(json.dumps(graded).encode('utf-8')))
+    self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+  def test_response_cache_revalidates(self):
+    """Cached documents are revalidated and reused across processes"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+    s = self.submission(filenames)
+    s.submit()
+    s.poll()
+
+    url = s._get_poll_url()
+    first = ResponseCache('cache.json').get(requests.Session(), url)
+    sent = self.standin.bytes_sent
+    second = ResponseCache('cache.json').get(requests.Session(), url)
+
+    self.assertEqual(first, second)
+    self.assertEqual(self.standin.bytes_sent, sent)
+    self.assertEqual(self.standin.not_modified, 1)
+
+  def test_gzipped_responses(self):
+    """Large feedback documents arrive gzipped and are decoded transparently"""
+    filenames = ['student_file1.py']
+    self.create_randomfiles(filenames, 1 << 10)
+    self.standin.grader = lambda z: {'console': 'test passed\n' * 20000}
+
+    sizes = []
+    for gzip_min_size in [None, 1 << 10]:
+      self.standin.gzip_min_size = gzip_min_size
+      s = self.submission(filenames)
+      s.submit()
+      sent = self.standin.bytes_sent
+      self.assertTrue(s.poll())
+      sizes.append(self.standin.bytes_sent - sent)
+      self.assertEqual(s.feedback(), {'console': 'test passed\n' * 20000})
+
+    self.assertLess(sizes[1] * 20, sizes[0])
+
+  def test_compressed_requests(self):
+    """Large json request bodies are gzipped when compression is enabled"""
+    filenames = ['student_file%d.py' % i for i in range(40)]
+    self.create_randomfiles(filenames, 1 << 4)
+    self.submission(filenames, incremental = True).submit()
+
+    sizes = []
+    for compress in [False, True]:
+      session = requests.Session()
+      if compress:
+        enable_request_compression(session)
+      s = Submission(self.standin.url, session, filenames, zipfile_root = '', incremental = True)
+
+      received = self.standin.bytes_received
+      s.submit()
+      sizes.append(self.standin.bytes_received - received)
+
+      self.assertEqual(s.uploaded_blobs, 0)
+      self.assertTrue(s.poll())
+      self.assertEqual(s.feedback(), {'files': sorted(filenames)})
+
+    self.assertLess(sizes[1] * 2, sizes[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import sys
+import subprocess
+
+def loaded_modules(code):
+  code += "; import sys; print(' '.join(sorted(sys.modules)))"
+  return set(subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').split())
+
+class TestStartup(unittest.TestCase):
+  """Heavy dependencies only load on the paths that use them (see benchmarks/bench_import.py for timings)"""
+
+  def test_submit_modules(self):
+    for module in ['nelson.gtomscs', 'nelson.udacity']:
+      loaded = loaded_modules('import ' + module)
+      for heavy in ['requests_toolbelt', 'pkg_resources', 'asyncio']:
+        self.assertNotIn(heavy, loaded, "%s loads %s" % (module, heavy))
+
+  def test_cli(self):
+    loaded = loaded_modules('from nelson.developer import main_func')
+    for heavy in ['requests', 'pkg_resources', 'nelson.gtomscs', 'nelson.udacity']:
+      self.assertNotIn(heavy, loaded)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import os
+import io
+import json
+import mock
+
+import nelson.abstract
+import nelson.sessionbuilder
+from nelson import telemetry
+from nelson.sessionbuilder import SessionBuilder
+from nelson.standin import Submission
+from standin_case import StandinTestCase
+
+class TestTelemetry(StandinTestCase):
+
+  def standin_options(self):
+    return {'pending_polls': 1}
+
+  def setUp(self):
+    super(TestTelemetry, self).setUp()
+    nelson.sessionbuilder._validated_tokens.clear()
+
+    with open('jwt', 'w') as fd:
+      json.dump({'developer': 'token'}, fd)
+    with open('student_file.py', 'w') as fd:
+      fd.write('print("hello")\n' * 100)
+
+  def tearDown(self):
+    telemetry.configure()
+    super(TestTelemetry, self).tearDown()
+
+  def test_records_submission_phases(self):
+    """Auth, zip, upload and wait are recorded with times, bytes and requests"""
+    records = []
+    summary = io.StringIO()
+    telemetry.configure(records.append, telemetry.JsonlSink('timings.jsonl'), telemetry.StderrSummary(stream = summary))
+
+    session = SessionBuilder(self.standin.url, 'developer', 'jwt').new()
+    s = Submission(self.standin.url, session, ['student_file.py'], zipfile_root = '')
+    with mock.patch('nelson.abstract.time.sleep'), mock.patch('sys.stdout'):
+      nelson.abstract.submit(s, refresh_time = 0.01)
+
+    spans = dict((r['name'], r) for r in records if r['type'] == 'span')
+    self.assertEqual(sorted(spans), ['auth', 'auth.load', 'auth.validate', 'upload', 'wait', 'zip'])
+    self.assertEqual(spans['auth.validate']['parent'], 'auth')
+    self.assertEqual(spans['zip']['parent'], 'upload')
+    self.assertEqual(spans['auth']['attrs']['requests'], 1)
+    self.assertEqual(spans['upload']['attrs']['mode'], 'file')
+    self.assertEqual(spans['upload']['attrs']['requests'], 1)
+    self.assertGreater(spans['upload']['attrs']['bytes'], spans['zip']['attrs']['bytes'])
+    self.assertEqual(spans['wait']['attrs']['polls'], 2)
+    self.assertEqual(spans['wait']['attrs']['requests'], 2)
+    self.assertEqual([r['attrs']['status'] for r in records if r['name'] == 'poll'], [200, 200])
+
+    with open('timings.jsonl') as fd:
+      self.assertEqual([json.loads(line)['name'] for line in fd], [r['name'] for r in records])
+    self.assertEqual([line.split()[1] for line in summary.getvalue().splitlines()], ['auth', 'upload', 'wait'])
+
+  def test_custom_spans(self):
+    """Submit scripts can record their own spans and events"""
+    records = []
+    telemetry.configure(records.append)
+
+    with telemetry.span('compile', target = 'hello') as span:
+      telemetry.event('warning', count = 2)
+      span.add('files', 3)
+
+    with self.assertRaises(ValueError):
+      with telemetry.span('check'):
+        raise ValueError("bad")
+
+    self.assertEqual([(r['type'], r['name'], r['parent']) for r in records],
+                     [('event', 'warning', 'compile'), ('span', 'compile', None), ('span', 'check', None)])
+    self.assertEqual(records[1]['attrs'], {'target': 'hello', 'files': 3})
+    self.assertEqual(records[2]['attrs'], {'error': 'bad'})
+
+  def test_disabled_by_default(self):
+    """Without sinks nothing is recorded"""
+    self.assertEqual(telemetry.recorder().sinks, [])
+    with telemetry.span('anything') as span:
+      span.set(bytes = 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import io
+
+from nelson.uploadcallbacks import ProgressRenderer, format_bytes, format_duration
+
+class FakeMonitor(object):
+  def __init__(self, total):
+    self.encoder = self
+    self.len = total
+    self.bytes_read = 0
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 100.
+
+  def __call__(self):
+    return self.now
+
+def upload(renderer, clock, monitor, chunks, chunk_size, seconds_per_chunk, total = None):
+  for _ in range(chunks):
+    clock.now += seconds_per_chunk
+    monitor.bytes_read += chunk_size
+    if total is not None and monitor.bytes_read + chunk_size > total:
+      monitor.len = total
+    renderer(monitor)
+
+class TestProgressRenderer(unittest.TestCase):
+
+  def setUp(self):
+    self.out = io.StringIO()
+    self.clock = FakeClock()
+
+  def test_throttles_terminal_redraws(self):
+    """On a terminal the line is redrawn at most max_redraws times a second"""
+    renderer = ProgressRenderer(stream = self.out, max_redraws = 10, interactive = True, clock = self.clock)
+    monitor = FakeMonitor(10000 << 10)
+    upload(renderer, self.clock, monitor, 10000, 1 << 10, 0.001)
+
+    draws = self.out.getvalue().split('\r')[1:]
+    self.assertLessEqual(len(draws), 10 * 10 + 2)
+    self.assertGreater(len(draws), 50)
+    self.assertNotIn('\n', self.out.getvalue())
+    self.assertIn('100%', draws[-1])
+    self.assertIn('in 0:10', draws[-1])
+    self.assertIn('1000.0 KB/s', draws[1])
+    self.assertIn('ETA 0:10', draws[1])
+
+    #Later calls at the end don't redraw
+    renderer(monitor)
+    self.assertEqual(len(self.out.getvalue().split('\r')[1:]), len(draws))
+
+  def test_sparse_lines_without_terminal(self):
+    """Without a terminal a line is printed at every tenth of the upload"""
+    renderer = ProgressRenderer(stream = self.out, interactive = False, clock = self.clock)
+    upload(renderer, self.clock, FakeMonitor(1000), 1000, 1, 0.01)
+
+    lines = self.out.getvalue().splitlines()
+    self.assertEqual(len(lines), 11)
+    self.assertIn('10%', lines[1])
+    self.assertIn('ETA 0:09', lines[1])
+    self.assertIn('100%', lines[-1])
+    self.assertNotIn('\r', self.out.getvalue())
+
+  def test_unknown_size(self):
+    """Streamed uploads print at each interval and once their size is known"""
+    renderer = ProgressRenderer(stream = self.out, interactive = False, line_interval = 1., clock = self.clock)
+    upload(renderer, self.clock, FakeMonitor(None), 500, 1 << 10, 0.01, total = 500 << 10)
+
+    lines = self.out.getvalue().splitlines()
+    self.assertEqual(len(lines), 6)
+    self.assertIn('sent', lines[0])
+    self.assertIn('100%', lines[-1])
+
+  def test_new_upload_restarts(self):
+    renderer = ProgressRenderer(stream = self.out, interactive = False, clock = self.clock)
+    upload(renderer, self.clock, FakeMonitor(10), 10, 1, 1.)
+    upload(renderer, self.clock, FakeMonitor(10), 10, 1, 1.)
+    self.assertEqual(len(self.out.getvalue().splitlines()), 20)
+
+  def test_formatting(self):
+    self.assertEqual(format_bytes(512), '512 B')
+    self.assertEqual(format_bytes(3 << 20), '3.0 MB')
+    self.assertEqual(format_duration(75), '1:15')
+    self.assertEqual(format_duration(3725), '1:02:05')
+
+if __name__ == '__main__':
+    unittest.main()